@@ -0,0 +1,334 @@
+"""批量导入试卷
+
+将目录或通配符匹配到的所有PDF复制到 exam_data/exams，提取题目并写入数据库。
+已导入过的文件（按内容SHA-256判断）会被跳过，可重复运行。
+试卷换成修订版时可用 --reingest 按页指纹只重新提取变化的页，
+修订版插入或删除题目导致题号移动时拒绝修补，需删除试卷后重新导入。
+导入时同时预先渲染各页的多级图片（见 page_pyramid.py），可用 --no-pyramid 跳过。
+
+用法：
+    python batch_ingest.py exams
+    python batch_ingest.py "pdfs/*.pdf" --workers 4
+    python batch_ingest.py --reingest 3 corrected.pdf
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from file_cache import file_sha256
+from instrumentation import Metrics, enable_logging
+from page_pyramid import build_pyramid, remove_pyramid
+from pdf_extractor import PDFExtractor
+from repository import ExamRepository
+
+EXAM_DIR = Path('exam_data/exams')
+
+
+def collect_pdfs(target: str) -> List[Path]:
+    """收集目录下或通配符匹配的PDF文件"""
+    path = Path(target)
+    if path.is_dir():
+        files = [p for p in path.iterdir() if p.suffix.lower() == '.pdf']
+    else:
+        files = [Path(p) for p in glob.glob(target) if p.lower().endswith('.pdf')]
+    return sorted(files)
+
+
+def _ingest_worker(source: str, target: str, use_cache: bool, pyramid: bool) -> Dict:
+    """子进程：复制文件、提取题目并预先渲染页面"""
+    timings = {}
+
+    start = time.perf_counter()
+    shutil.copy2(source, target)
+    timings['copy'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extractor = PDFExtractor(use_cache=use_cache)
+    extracted = extractor.extract_pages(target)
+    timings['extract'] = time.perf_counter() - start
+
+    if pyramid:
+        # 各文件已在不同进程中并行，每个文件内不再分进程
+        start = time.perf_counter()
+        build_pyramid(target, workers=1)
+        timings['render'] = time.perf_counter() - start
+
+    return {
+        'questions': extracted['questions'],
+        'pages': extracted['pages'],
+        'timings': timings,
+        'metrics': extractor.metrics.as_dict()
+    }
+
+
+class BatchIngester:
+    def __init__(self, db_path: str = 'gespexam.db', workers: Optional[int] = None, use_cache: bool = True,
+                 pyramid: bool = True):
+        self.workers = workers or os.cpu_count() or 1
+        self.use_cache = use_cache
+        # 是否在导入时预先渲染页面图片
+        self.pyramid = pyramid
+        # 汇总各子进程提取时的阶段耗时和计数
+        self.metrics = Metrics()
+        # 试卷和题目通过数据访问层写入，页面指纹和导入记录在同一连接的同一事务中写入
+        self.repository = ExamRepository(db_path)
+        self.conn = self.repository.conn
+        EXAM_DIR.mkdir(parents=True, exist_ok=True)
+
+    def ingest(self, files: List[Path]) -> List[Dict]:
+        """导入文件列表，返回每个文件的处理结果"""
+        results = []
+        pending = []
+        seen_hashes = set()
+        claimed_targets = set()
+
+        # 先在主进程中计算哈希，跳过已导入和本次重复的文件
+        for source in files:
+            result = {'source': source, 'status': 'pending', 'timings': {}, 'questions': 0}
+            results.append(result)
+            try:
+                start = time.perf_counter()
+                file_hash = file_sha256(source)
+                result['timings']['hash'] = time.perf_counter() - start
+            except OSError as e:
+                result['status'] = 'failed'
+                result['error'] = str(e)
+                continue
+
+            if file_hash in seen_hashes or self._is_ingested(file_hash):
+                result['status'] = 'skipped'
+                continue
+
+            seen_hashes.add(file_hash)
+            result['hash'] = file_hash
+            result['target'] = self._target_path(source, file_hash, claimed_targets)
+            claimed_targets.add(result['target'])
+            pending.append(result)
+
+        total = len(pending)
+        if total:
+            print(f"待导入 {total} 个文件，跳过 {len(results) - total} 个，使用 {self.workers} 个进程")
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(_ingest_worker, str(r['source']), str(r['target']), self.use_cache, self.pyramid): r
+                for r in pending
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                result = futures[future]
+                try:
+                    output = future.result()
+                    result['timings'].update(output['timings'])
+                    self.metrics.merge(output['metrics'])
+
+                    start = time.perf_counter()
+                    self._insert_exam(result, output['questions'], output['pages'])
+                    result['timings']['insert'] = time.perf_counter() - start
+
+                    result['questions'] = len(output['questions'])
+                    result['status'] = 'ok'
+                except Exception as e:
+                    result['status'] = 'failed'
+                    result['error'] = str(e)
+
+                elapsed = sum(result['timings'].values())
+                print(f"[{done}/{total}] {result['source'].name}: {result['status']} ({elapsed:.2f}s)")
+
+        return results
+
+    def _is_ingested(self, file_hash: str) -> bool:
+        """检查文件是否已导入（对应试卷仍存在）"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT 1
+            FROM ingested_files f
+            JOIN exams e ON e.id = f.exam_id
+            WHERE f.file_hash = ?
+        """, (file_hash,))
+        return cursor.fetchone() is not None
+
+    def _target_path(self, source: Path, file_hash: str, claimed: set) -> Path:
+        """确定存储路径，同名但内容不同的文件追加哈希前缀避免覆盖"""
+        target = EXAM_DIR / source.name
+        if target in claimed or (target.exists() and file_sha256(target) != file_hash):
+            target = EXAM_DIR / f"{source.stem}_{file_hash[:8]}{source.suffix}"
+        return target
+
+    def _insert_exam(self, result: Dict, questions: List[Dict], pages: List[Dict]):
+        """在一个事务中写入试卷、题目、页面指纹和导入记录"""
+        source = result['source']
+        with self.repository.transaction():
+            exam_id = self.repository.add_exam(source.name, source.name, str(result['target']),
+                                               source.suffix.lower())
+            self.repository.add_questions(exam_id, questions, complete=True)
+
+            cursor = self.conn.cursor()
+            self._save_pages(cursor, exam_id, pages)
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO ingested_files (file_hash, exam_id, source_path)
+                VALUES (?, ?, ?)
+            ''', (result['hash'], exam_id, str(source)))
+        result['exam_id'] = exam_id
+
+    def reingest(self, exam_id: int, source: Path) -> Dict:
+        """用修订后的PDF替换试卷，只重新提取指纹变化的页并在一个事务中修补题目
+
+        先从新文件提取，事务提交后才覆盖存储的PDF，提取或写入数据库失败时
+        存储的文件和数据库仍对应旧版本。
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT file_path FROM exams WHERE id = ?", (exam_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError(f"试卷不存在: {exam_id}")
+        target = row[0]
+
+        cursor.execute("""
+            SELECT page_number, fingerprint, events
+            FROM page_fingerprints
+            WHERE exam_id = ?
+        """, (exam_id,))
+        known = {
+            page_number: {'fingerprint': fingerprint, 'events': json.loads(events)}
+            for page_number, fingerprint, events in cursor.fetchall()
+        }
+
+        cursor.execute("SELECT file_hash FROM ingested_files WHERE exam_id = ?", (exam_id,))
+        old_hashes = {h for h, in cursor.fetchall()}
+
+        file_hash = file_sha256(source)
+        extractor = PDFExtractor(use_cache=self.use_cache)
+        extracted = extractor.extract_pages(str(source), known)
+        self.metrics.merge(extractor.metrics)
+        changed = set(extracted['changed'])
+
+        with self.repository.transaction():
+            stats = self.repository.patch_questions(exam_id, extracted['questions'])
+            self._save_pages(cursor, exam_id, [p for p in extracted['pages'] if p['page_number'] in changed])
+            cursor.execute("DELETE FROM page_fingerprints WHERE exam_id = ? AND page_number > ?",
+                           (exam_id, len(extracted['pages'])))
+
+            cursor.execute("DELETE FROM ingested_files WHERE exam_id = ?", (exam_id,))
+            # 同一PDF已作为另一份仍存在的试卷导入时保留那份试卷的导入记录
+            cursor.execute("""
+                SELECT 1
+                FROM ingested_files f
+                JOIN exams e ON e.id = f.exam_id
+                WHERE f.file_hash = ? AND f.exam_id != ?
+            """, (file_hash, exam_id))
+            if cursor.fetchone() is None:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO ingested_files (file_hash, exam_id, source_path)
+                    VALUES (?, ?, ?)
+                ''', (file_hash, exam_id, str(source)))
+
+        if Path(source).resolve() != Path(target).resolve():
+            shutil.copy2(source, target)
+
+        if self.pyramid:
+            build_pyramid(target, workers=self.workers)
+            # 旧版本的图片不再被任何试卷使用时删除
+            for old_hash in old_hashes - {file_hash}:
+                cursor.execute("SELECT 1 FROM ingested_files WHERE file_hash = ?", (old_hash,))
+                if cursor.fetchone() is None:
+                    remove_pyramid(old_hash)
+
+        stats['changed_pages'] = sorted(changed)
+        return stats
+
+    def _save_pages(self, cursor, exam_id: int, pages: List[Dict]):
+        """保存页面指纹和该页的提取结果"""
+        cursor.executemany('''
+            INSERT OR REPLACE INTO page_fingerprints (exam_id, page_number, fingerprint, events)
+            VALUES (?, ?, ?, ?)
+        ''', [
+            (exam_id, p['page_number'], p['fingerprint'], json.dumps(p['events'], ensure_ascii=False))
+            for p in pages
+        ])
+
+    def close(self):
+        """关闭数据库连接"""
+        self.repository.close()
+
+
+def print_summary(results: List[Dict], metrics: Optional[Metrics] = None):
+    """打印每个文件的耗时汇总，以及提取阶段的耗时和计数"""
+    stages = ['hash', 'copy', 'extract', 'render', 'insert']
+    print()
+    print(f"{'文件':<40} {'状态':<8} {'题数':>4} " + ' '.join(f"{s:>8}" for s in stages) + f" {'合计':>8}")
+    for r in results:
+        timings = r['timings']
+        cells = ' '.join(f"{timings[s]:8.2f}" if s in timings else f"{'-':>8}" for s in stages)
+        print(f"{r['source'].name:<40} {r['status']:<8} {r['questions']:>4} {cells} {sum(timings.values()):8.2f}")
+        if r.get('error'):
+            print(f"    错误: {r['error']}")
+
+    counts = {}
+    for r in results:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    print()
+    print("汇总: " + ', '.join(f"{status} {count}" for status, count in sorted(counts.items())))
+    if metrics and (metrics.timings or metrics.counters):
+        print(metrics.format("\n提取统计（各进程合计）:"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量导入PDF试卷")
+    parser.add_argument('targets', nargs='+', help="PDF所在目录或通配符，如 exams 或 \"pdfs/*.pdf\"")
+    parser.add_argument('--workers', type=int, default=None, help="并行进程数，默认为CPU核数")
+    parser.add_argument('--db', default='gespexam.db', help="数据库文件路径")
+    parser.add_argument('--no-cache', action='store_true', help="不使用提取结果缓存")
+    parser.add_argument('--no-pyramid', action='store_true', help="不预先渲染页面图片")
+    parser.add_argument('--reingest', type=int, metavar='EXAM_ID',
+                        help="用给定的PDF替换该试卷，只重新提取变化的页")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="输出提取日志，-vv 输出调试信息")
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        enable_logging(logging.DEBUG if args.verbose > 1 else logging.INFO)
+
+    if args.reingest is not None:
+        if len(args.targets) != 1 or not Path(args.targets[0]).is_file():
+            parser.error("--reingest 需要且只需要一个PDF文件")
+        ingester = BatchIngester(args.db, use_cache=not args.no_cache, pyramid=not args.no_pyramid)
+        try:
+            stats = ingester.reingest(args.reingest, Path(args.targets[0]))
+        except ValueError as e:
+            print(f"重新导入失败: {e}")
+            return 1
+        finally:
+            ingester.close()
+        print(f"变化的页: {stats['changed_pages'] or '无'}")
+        print(f"更新 {stats['updated']} 题, 新增 {stats['inserted']} 题, 删除 {stats['deleted']} 题")
+        print(ingester.metrics.format("\n提取统计:"))
+        return 0
+
+    files = []
+    for target in args.targets:
+        files.extend(collect_pdfs(target))
+    if not files:
+        print("没有找到PDF文件")
+        return 1
+
+    ingester = BatchIngester(args.db, args.workers, use_cache=not args.no_cache, pyramid=not args.no_pyramid)
+    try:
+        results = ingester.ingest(files)
+    finally:
+        ingester.close()
+
+    print_summary(results, ingester.metrics)
+    return 1 if any(r['status'] == 'failed' for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
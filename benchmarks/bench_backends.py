@@ -0,0 +1,93 @@
+"""ExamParser 文本后端对比
+
+对 exams/*.pdf 分别用各文本后端提取并识别题目，报告每秒页数、峰值内存
+以及各后端识别出的题目数量是否一致。每次测量在独立的子进程中进行，
+峰值内存互不影响。
+
+用法：
+    python benchmarks/bench_backends.py
+    python benchmarks/bench_backends.py exams/202403一级.pdf --repeat 3
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from common import ROOT, format_mb, peak_rss_mb, run_isolated
+from pdf_parser import ExamParser, TEXT_BACKENDS
+
+
+def measure(backend_name, pdf_path):
+    """子进程：用指定后端提取并识别一份试卷"""
+    baseline = peak_rss_mb()
+    pages = 0
+
+    def counted(page_texts):
+        nonlocal pages
+        for page_text in page_texts:
+            pages += 1
+            yield page_text
+
+    start = time.perf_counter()
+    page_texts = TEXT_BACKENDS[backend_name]().iter_page_texts(pdf_path)
+    questions = ExamParser(use_cache=False).parse_pages(counted(page_texts))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'pages': pages,
+        'questions': len(questions),
+        'types': [q['type'] for q in questions],
+        'elapsed': elapsed,
+        'baseline_rss': baseline,
+        'peak_rss': peak_rss_mb()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比 ExamParser 各文本后端的速度、内存和识别结果")
+    parser.add_argument('pdfs', nargs='*', help="PDF文件，默认 exams/*.pdf")
+    parser.add_argument('--repeat', type=int, default=1, help="每个后端重复次数，取最快一次")
+    args = parser.parse_args(argv)
+
+    pdfs = [Path(p) for p in args.pdfs] or sorted((ROOT / 'exams').glob('*.pdf'))
+    backends = list(TEXT_BACKENDS)
+
+    print(f"{'文件':<36} {'后端':<8} {'页数':>4} {'页/秒':>8} {'峰值MB':>8} {'增量MB':>8} {'题数':>4}")
+    totals = {name: {'pages': 0, 'elapsed': 0.0} for name in backends}
+    disagreements = 0
+    for pdf in pdfs:
+        results = {}
+        for name in backends:
+            try:
+                runs = [run_isolated(measure, name, str(pdf)) for _ in range(args.repeat)]
+            except Exception as e:
+                print(f"{pdf.name:<36} {name:<8} 失败: {e}")
+                continue
+            result = min(runs, key=lambda r: r['elapsed'])
+            results[name] = result
+            totals[name]['pages'] += result['pages']
+            totals[name]['elapsed'] += result['elapsed']
+
+            rate = result['pages'] / result['elapsed'] if result['elapsed'] else 0.0
+            delta = (result['peak_rss'] - result['baseline_rss']
+                     if result['peak_rss'] is not None else None)
+            print(f"{pdf.name:<36} {name:<8} {result['pages']:>4} {rate:>8.1f} "
+                  f"{format_mb(result['peak_rss'])} {format_mb(delta)} {result['questions']:>4}")
+
+        if len(results) == len(backends):
+            counts = {r['questions'] for r in results.values()}
+            types = {tuple(r['types']) for r in results.values()}
+            if len(counts) > 1 or len(types) > 1:
+                disagreements += 1
+                print(f"{'':<36} 各后端识别结果不一致")
+
+    print()
+    for name, total in totals.items():
+        if total['elapsed']:
+            print(f"{name:<8} 合计 {total['pages']} 页, {total['pages'] / total['elapsed']:.1f} 页/秒")
+    print(f"题目数量不一致的试卷: {disagreements}/{len(pdfs)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
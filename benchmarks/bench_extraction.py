@@ -0,0 +1,208 @@
+"""题目提取基准与回归语料
+
+对 exams/ 和 pdfs/ 下的每份PDF分别运行 PDFExtractor 和 ExamParser，记录各阶段
+耗时（读取、提取、识别、图片、分组）、峰值内存和识别出的题目，并与 benchmarks/golden/
+中保存的基准结果比较：题目不一致，或吞吐量（页/秒）比基准下降超过阈值时以非零
+状态退出。每次测量在独立的子进程中进行，图片写入临时目录，不影响 exam_data/。
+
+用法：
+    python benchmarks/bench_extraction.py
+    python benchmarks/bench_extraction.py exams/202403一级.pdf --threshold 0.5
+    python benchmarks/bench_extraction.py --update-golden
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import ROOT, format_mb, peak_rss_mb, run_isolated
+from pdf_extractor import PDFExtractor
+from pdf_parser import ExamParser, TEXT_BACKENDS
+
+GOLDEN_DIR = ROOT / 'benchmarks' / 'golden'
+CORPUS_DIRS = ('exams', 'pdfs')
+EXTRACTORS = ('pdf_extractor', 'exam_parser')
+# 两种提取器记录的阶段，见 instrumentation.Metrics
+STAGES = ('read', 'extract', 'classify', 'image', 'group')
+STAGE_WIDTH = 11
+
+
+def normalize_extractor_question(question):
+    """图片路径只保留内容哈希文件名，与运行目录和操作系统无关"""
+    question = dict(question)
+    if question['question_image_path']:
+        paths = json.loads(question['question_image_path'])
+        question['question_image_path'] = [Path(p).name for p in paths]
+    return question
+
+
+def measure_extractor(pdf_path):
+    """子进程：运行 PDFExtractor，阶段耗时取自提取器的计时记录"""
+    baseline = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        extractor = PDFExtractor(use_cache=False)
+        start = time.perf_counter()
+        questions = extractor.extract_questions(pdf_path)
+        elapsed = time.perf_counter() - start
+
+    return {
+        'pages': extractor.metrics.counters.get('pages', 0),
+        'elapsed': elapsed,
+        'stages': extractor.metrics.timings,
+        'questions': [normalize_extractor_question(q) for q in questions],
+        'baseline_rss': baseline,
+        'peak_rss': peak_rss_mb()
+    }
+
+
+def measure_parser(pdf_path, backend):
+    """子进程：运行 ExamParser，阶段耗时取自解析器的计时记录"""
+    baseline = peak_rss_mb()
+    parser = ExamParser(use_cache=False, backend=backend)
+    start = time.perf_counter()
+    found = list(parser.iter_questions(pdf_path))
+    with parser.metrics.span('group'):
+        questions = parser._group_by_type(found)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'pages': parser.metrics.counters.get('pages', 0),
+        'elapsed': elapsed,
+        'stages': parser.metrics.timings,
+        'questions': questions,
+        'baseline_rss': baseline,
+        'peak_rss': peak_rss_mb()
+    }
+
+
+def measure(name, pdf_path, backend):
+    if name == 'pdf_extractor':
+        return measure_extractor(pdf_path)
+    return measure_parser(pdf_path, backend)
+
+
+def collect_corpus():
+    return [pdf for folder in CORPUS_DIRS for pdf in sorted((ROOT / folder).glob('*.pdf'))]
+
+
+def golden_path(pdf):
+    """同名文件可能同时出现在 exams/ 和 pdfs/，以目录名区分"""
+    return GOLDEN_DIR / f"{pdf.parent.name}_{pdf.stem}.json"
+
+
+def load_golden(pdf):
+    path = golden_path(pdf)
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_golden(pdf, results):
+    GOLDEN_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        source = pdf.resolve().relative_to(ROOT).as_posix()
+    except ValueError:
+        source = pdf.name
+    golden = {'pdf': source, 'extractors': results}
+    with open(golden_path(pdf), 'w', encoding='utf-8') as f:
+        json.dump(golden, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def summarize(result):
+    """基准文件中保存的内容：页数、吞吐量和题目"""
+    if 'error' in result:
+        return {'error': result['error']}
+    rate = result['pages'] / result['elapsed'] if result['elapsed'] else 0.0
+    return {
+        'pages': result['pages'],
+        'pages_per_sec': round(rate, 1),
+        'questions': result['questions']
+    }
+
+
+def compare(summary, expected, threshold):
+    """与基准比较，返回问题列表"""
+    if expected is None:
+        return ['缺少基准']
+    problems = []
+    if summary.get('error') != expected.get('error'):
+        problems.append(f"错误不一致: {summary.get('error')!r} != {expected.get('error')!r}")
+    if summary.get('questions') != expected.get('questions'):
+        problems.append(f"题目不一致: {len(summary.get('questions') or [])} 道 / 基准 {len(expected.get('questions') or [])} 道")
+    # 页数过少时计时噪声太大，不参与吞吐量比较
+    expected_rate = expected.get('pages_per_sec')
+    if expected_rate and summary.get('pages', 0) >= 2:
+        floor = expected_rate * (1 - threshold)
+        if summary['pages_per_sec'] < floor:
+            problems.append(f"吞吐量下降: {summary['pages_per_sec']:.1f} 页/秒 < {floor:.1f} "
+                            f"(基准 {expected_rate:.1f})")
+    return problems
+
+
+def format_stage(stages, stage):
+    return f"{stages[stage] * 1000:>{STAGE_WIDTH}.1f}" if stage in stages else f"{'-':>{STAGE_WIDTH}}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="提取基准测试，并与保存的基准结果比较")
+    parser.add_argument('pdfs', nargs='*', help="PDF文件，默认 exams/ 和 pdfs/ 下的全部PDF")
+    parser.add_argument('--repeat', type=int, default=3, help="每项测量重复次数，取最快一次")
+    parser.add_argument('--threshold', type=float, default=0.3,
+                        help="允许的吞吐量下降比例，默认 0.3 即低于基准的 70%% 时失败")
+    parser.add_argument('--backend', default='pypdf2', choices=list(TEXT_BACKENDS),
+                        help="ExamParser 使用的文本后端")
+    parser.add_argument('--update-golden', action='store_true', help="用本次结果覆盖基准文件")
+    args = parser.parse_args(argv)
+
+    pdfs = [Path(p).resolve() for p in args.pdfs] or collect_corpus()
+
+    print(f"{'文件':<36} {'提取器':<13} {'页数':>4} "
+          + ' '.join(f"{stage + 'ms':>{STAGE_WIDTH}}" for stage in STAGES)
+          + f" {'页/秒':>7} {'峰值MB':>8} {'题数':>4} 结果")
+    failures = 0
+    for pdf in pdfs:
+        label = f"{pdf.parent.name}/{pdf.name}"
+        golden = load_golden(pdf) or {}
+        summaries = {}
+        for name in EXTRACTORS:
+            try:
+                runs = [run_isolated(measure, name, str(pdf), args.backend) for _ in range(args.repeat)]
+            except Exception as e:
+                summaries[name] = summarize({'error': str(e)})
+                problems = [] if args.update_golden else compare(
+                    summaries[name], golden.get('extractors', {}).get(name), args.threshold)
+                failures += bool(problems)
+                print(f"{label:<36} {name:<13} 失败: {e} {'; '.join(problems)}")
+                continue
+
+            result = min(runs, key=lambda r: r['elapsed'])
+            summary = summaries[name] = summarize(result)
+            problems = [] if args.update_golden else compare(
+                summary, golden.get('extractors', {}).get(name), args.threshold)
+            failures += bool(problems)
+
+            stages = result['stages']
+            print(f"{label:<36} {name:<13} {result['pages']:>4} "
+                  + ' '.join(format_stage(stages, stage) for stage in STAGES)
+                  + f" {summary['pages_per_sec']:>7.1f} "
+                  f"{format_mb(result['peak_rss'])} {len(result['questions']):>4} "
+                  f"{'; '.join(problems) or '通过'}")
+
+        if args.update_golden:
+            save_golden(pdf, summaries)
+
+    if args.update_golden:
+        print(f"\n已更新 {len(pdfs)} 个基准文件: {GOLDEN_DIR}")
+        return 0
+    print(f"\n未通过: {failures}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
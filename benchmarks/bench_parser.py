@@ -0,0 +1,116 @@
+"""ExamParser 题目识别性能对比
+
+对 exams/*.pdf 先用 PyPDF2 提取文本，再分别用原先的三遍正则实现和
+当前的单遍逐行扫描实现识别题目，检查结果一致并报告耗时和加速比。
+
+用法：
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --repeat 20 --scale 10
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+import PyPDF2
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pdf_parser import ExamParser  # noqa: E402
+
+# 原先 ExamParser 在全文上执行的正则，作为对照实现保留在这里
+LEGACY_PATTERNS = {
+    'single_choice': r'(?:选择题|单选题)[^\n]*(?:\n|.)*?(?:\d+[\.、]|\([A-D]\))\s*(.*?)(?=(?:\d+[\.、]|\([A-D]\))|$)',
+    'true_false': r'(?:判断题)[^\n]*(?:\n|.)*?(?:\d+[\.、])\s*(.*?)(?=\d+[\.、]|$)',
+    'programming': r'(?:编程题|程序题)[^\n]*(?:\n|.)*?(?:\d+[\.、])\s*(.*?)(?=\d+[\.、]|$)'
+}
+LEGACY_OPTION_PATTERN = r'[A-D][\.、](.*?)(?=[A-D][\.、]|$)'
+
+
+def legacy_parse(page_texts):
+    """原实现：拼接全文后对每种题型各做一遍 re.finditer"""
+    text = ""
+    for page_text in page_texts:
+        text += page_text
+
+    questions = []
+    for match in re.finditer(LEGACY_PATTERNS['single_choice'], text, re.DOTALL):
+        question_text = match.group(1).strip()
+        options = re.findall(LEGACY_OPTION_PATTERN, question_text)
+        if options:
+            questions.append({
+                'type': 'single_choice',
+                'text': question_text.split('A.')[0].strip(),
+                'options': options,
+                'score': 10
+            })
+    for match in re.finditer(LEGACY_PATTERNS['true_false'], text, re.DOTALL):
+        questions.append({'type': 'true_false', 'text': match.group(1).strip(), 'score': 5})
+    for match in re.finditer(LEGACY_PATTERNS['programming'], text, re.DOTALL):
+        questions.append({'type': 'programming', 'text': match.group(1).strip(), 'score': 20})
+    return questions
+
+
+def streaming_parse(page_texts):
+    """当前实现：单遍扫描状态机"""
+    return ExamParser(use_cache=False).parse_pages(page_texts)
+
+
+def read_page_texts(pdf_path):
+    with open(pdf_path, 'rb') as f:
+        return [page.extract_text() for page in PyPDF2.PdfReader(f).pages]
+
+
+def best_time(func, page_texts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(page_texts)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比原正则实现与单遍扫描实现的识别耗时")
+    parser.add_argument('pdfs', nargs='*', help="PDF文件，默认 exams/*.pdf")
+    parser.add_argument('--repeat', type=int, default=5, help="每个实现重复次数，取最快一次")
+    parser.add_argument('--scale', type=int, default=1, help="把每份试卷的页面重复若干次，模拟长文档")
+    args = parser.parse_args(argv)
+
+    pdfs = [Path(p) for p in args.pdfs] or sorted((ROOT / 'exams').glob('*.pdf'))
+
+    print(f"{'文件':<36} {'页数':>4} {'题数':>4} {'原实现(ms)':>10} {'新实现(ms)':>10} {'加速比':>7} 结果")
+    total_legacy = total_streaming = 0.0
+    mismatches = 0
+    for pdf in pdfs:
+        try:
+            page_texts = read_page_texts(pdf) * args.scale
+        except Exception as e:
+            print(f"{pdf.name:<36} 无法读取: {e}")
+            continue
+
+        legacy = legacy_parse(page_texts)
+        streaming = streaming_parse(page_texts)
+        same = legacy == streaming
+        mismatches += not same
+
+        legacy_time = best_time(legacy_parse, page_texts, args.repeat)
+        streaming_time = best_time(streaming_parse, page_texts, args.repeat)
+        total_legacy += legacy_time
+        total_streaming += streaming_time
+
+        speedup = legacy_time / streaming_time if streaming_time else float('inf')
+        print(f"{pdf.name:<36} {len(page_texts):>4} {len(streaming):>4} "
+              f"{legacy_time * 1000:>10.2f} {streaming_time * 1000:>10.2f} {speedup:>6.1f}x "
+              f"{'一致' if same else '不一致'}")
+
+    if total_streaming:
+        print(f"\n合计: 原实现 {total_legacy * 1000:.2f}ms, 新实现 {total_streaming * 1000:.2f}ms, "
+              f"加速比 {total_legacy / total_streaming:.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
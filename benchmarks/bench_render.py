@@ -0,0 +1,108 @@
+"""页面图片交给 Tk 的两种方式对比
+
+pil: pixmap → pix.samples → Image.frombytes → ImageTk.PhotoImage（原先的方式）
+ppm: pixmap → pix.tobytes("ppm") → tk.PhotoImage（考试窗口当前的方式）
+
+对每份试卷的每页按考试窗口的默认缩放渲染并转换，报告每页平均耗时和峰值内存。
+每种方式在独立的子进程中运行，峰值内存互不影响。没有图形显示环境时无法
+创建 Tk 图片，只测量交给 Tk 之前的部分。
+
+用法：
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py exams/202403一级.pdf --zoom 2.16 --repeat 3
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from common import ROOT, format_mb, peak_rss_mb, run_isolated
+
+METHODS = ('pil', 'ppm')
+
+
+def open_tk():
+    """创建隐藏的 Tk 根窗口，没有显示环境时返回 None"""
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    return root
+
+
+def measure(method, pdf_paths, zoom_level, repeat):
+    """子进程：用指定方式渲染并转换所有页面"""
+    import fitz
+    import tkinter as tk
+
+    root = open_tk()
+    if method == 'pil':
+        from PIL import Image, ImageTk
+
+    baseline = peak_rss_mb()
+    matrix = fitz.Matrix(2 * zoom_level, 2 * zoom_level)
+    render = convert = 0.0
+    pages = 0
+    # 与考试窗口一样，新图片替换旧图片后旧图片才释放
+    photo = None
+    for pdf_path in pdf_paths:
+        doc = fitz.open(pdf_path)
+        try:
+            for page in doc:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    pix = page.get_pixmap(matrix=matrix)
+                    render += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    if method == 'pil':
+                        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                        photo = ImageTk.PhotoImage(img) if root else img
+                    else:
+                        data = pix.tobytes("ppm")
+                        photo = tk.PhotoImage(master=root, data=data, format='PPM') if root else data
+                    convert += time.perf_counter() - start
+                    pages += 1
+        finally:
+            doc.close()
+
+    if root:
+        root.destroy()
+    return {
+        'pages': pages,
+        'render': render,
+        'convert': convert,
+        'tk': root is not None,
+        'baseline_rss': baseline,
+        'peak_rss': peak_rss_mb()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比 PIL 和 PPM 两种交给 Tk 的方式")
+    parser.add_argument('pdfs', nargs='*', help="PDF文件，默认 exams/*.pdf")
+    parser.add_argument('--zoom', type=float, default=1.5, help="缩放级别，默认与考试窗口相同")
+    parser.add_argument('--repeat', type=int, default=1, help="每页重复次数")
+    args = parser.parse_args(argv)
+
+    pdfs = [str(Path(p)) for p in args.pdfs] or [str(p) for p in sorted((ROOT / 'exams').glob('*.pdf'))]
+
+    print(f"{'方式':<6} {'页数':>5} {'渲染ms/页':>10} {'转换ms/页':>10} {'合计ms/页':>10} {'峰值MB':>8} {'增量MB':>8}")
+    for method in METHODS:
+        result = run_isolated(measure, method, pdfs, args.zoom, args.repeat)
+        pages = result['pages'] or 1
+        delta = (result['peak_rss'] - result['baseline_rss']
+                 if result['peak_rss'] is not None else None)
+        print(f"{method:<6} {result['pages']:>5} {result['render'] / pages * 1000:>10.2f} "
+              f"{result['convert'] / pages * 1000:>10.2f} "
+              f"{(result['render'] + result['convert']) / pages * 1000:>10.2f} "
+              f"{format_mb(result['peak_rss'])} {format_mb(delta)}")
+    if not result['tk']:
+        print("\n没有图形显示环境，转换只测量到交给 Tk 之前")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
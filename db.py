@@ -0,0 +1,27 @@
+"""数据库连接
+
+所有模块都通过 connect_db() 打开 gespexam.db，统一设置：
+- WAL 日志：读写互不阻塞，多个考试窗口和管理界面可同时使用
+- synchronous=NORMAL：WAL 模式下仍保证一致性，提交时不再每次同步到磁盘
+- 忙等待超时：其他连接正在写入时等待而不是立即报 "database is locked"
+并在打开时把数据库结构迁移到最新版本（见 migrations.py）。
+"""
+import sqlite3
+
+from migrations import migrate
+
+DB_PATH = 'gespexam.db'
+
+# 等待其他连接释放写锁的最长时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+
+def connect_db(path: str = DB_PATH) -> sqlite3.Connection:
+    """打开数据库连接，应用统一的连接设置并迁移数据库结构"""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # WAL 设置保存在数据库文件中，之后的连接自动沿用
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    migrate(conn)
+    return conn
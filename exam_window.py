@@ -1,30 +1,75 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
-import json
 from datetime import datetime
 import fitz  # PyMuPDF
-from PIL import Image, ImageTk
 import io
 import os
+from file_cache import RenderDiskCache, file_sha256
+from grading import grade_by_number, total_score
+from render_cache import RenderCache, DEFAULT_RENDER_CACHE_BYTES, zoom_key
+from page_renderer import (
+    DEFAULT_DISPLAY_LISTS, FITZ_LOCK, PREVIEW_ZOOM, TILE_SIZE, TILE_ZOOM, PageRenderer, RenderWorker,
+    neighbour_pages, page_scale, question_regions, tiles_in_region
+)
+from page_pyramid import PagePyramid
+from repository import get_repository
+
+# 检查后台渲染结果的间隔（毫秒）
+RENDER_POLL_MS = 50
+# 最后一次缩放后等待多久再清晰渲染（毫秒）
+ZOOM_SETTLE_MS = 300
 
 class ExamWindow:
-    def __init__(self, parent, exam_id):
+    def __init__(self, parent, exam_id, render_cache_bytes=DEFAULT_RENDER_CACHE_BYTES, prefetch_pages=2,
+                 display_lists=DEFAULT_DISPLAY_LISTS, use_disk_cache=True, use_pyramid=True):
         self.window = tk.Toplevel(parent)
         self.window.title("考试界面")
         self.window.attributes('-fullscreen', True)
         
         self.exam_id = exam_id
-        self.conn = sqlite3.connect('gespexam.db')
+        self.repository = get_repository()
         self.load_exam_info()
         
         self.current_page = 0
+        # 按题显示时当前题目在页面上的区域（页面坐标），整页显示时为 None
+        self.current_clip = None
+        # 可翻阅的画面 (页索引, 裁剪区域, 题号)，按题显示时每题一个，否则每页一个
+        self.views = []
+        self.view_index = 0
+        self.question_views = []
+        self.question_mode = True
         self.student_answers = {}
         self.start_time = datetime.now()
         self.zoom_level = 1.5  # 默认缩放级别
+        # 'width' 适应宽度、'page' 适应页面时缩放由画布尺寸决定，None 为手动缩放
+        self.fit_mode = None
+        self._canvas_size = None
+        # 已渲染页面的缓存，来回翻页和缩放时直接显示
+        self.render_cache = RenderCache(render_cache_bytes)
+        # 显示当前页后在后台预先渲染前后各 prefetch_pages 页
+        self.prefetch_pages = prefetch_pages
+        # 最多保留的页面显示列表数
+        self.display_lists = display_lists
+        # 渲染结果保存在 exam_data/cache/render，多次考试和多台考试机共用
+        self.use_disk_cache = use_disk_cache
+        # 优先使用导入时预先渲染的页面图片（exam_data/pyramids）
+        self.use_pyramid = use_pyramid
+        self.prefetcher = None
+        # 当前页的清晰渲染在后台进行，完成前显示预览
+        self.renderer = None
+        self._pending = None
+        self._render_poll = None
+        self._zoom_settle = None
+        # 图块模式下当前页的像素尺寸、已显示的图块及待执行的补充渲染
+        self.page_size = None
+        self.tile_photos = {}
+        self._tile_update = None
         
         self.create_interface()
         self.load_pdf()
+        self.load_question_views()
+        # 先完成布局，使画布尺寸可用于计算可见区域
+        self.window.update_idletasks()
         self.show_current_page()
         self.update_timer()
 
@@ -48,6 +93,10 @@ class ExamWindow:
         
         ttk.Button(zoom_frame, text="放大", command=self.zoom_in).pack(side=tk.LEFT, padx=5)
         ttk.Button(zoom_frame, text="缩小", command=self.zoom_out).pack(side=tk.LEFT, padx=5)
+        ttk.Button(zoom_frame, text="适应宽度", command=lambda: self.set_fit_mode('width')).pack(side=tk.LEFT, padx=5)
+        ttk.Button(zoom_frame, text="适应页面", command=lambda: self.set_fit_mode('page')).pack(side=tk.LEFT, padx=5)
+        self.mode_button = ttk.Button(zoom_frame, text="整页显示", command=self.toggle_question_mode)
+        self.mode_button.pack(side=tk.LEFT, padx=5)
         
         # 试卷显示区域（带滚动条）
         self.pdf_frame = ttk.Frame(main_frame)
@@ -55,8 +104,8 @@ class ExamWindow:
         
         # 创建画布和滚动条
         self.pdf_canvas = tk.Canvas(self.pdf_frame, bg='white')
-        h_scrollbar = ttk.Scrollbar(self.pdf_frame, orient=tk.HORIZONTAL, command=self.pdf_canvas.xview)
-        v_scrollbar = ttk.Scrollbar(self.pdf_frame, orient=tk.VERTICAL, command=self.pdf_canvas.yview)
+        h_scrollbar = ttk.Scrollbar(self.pdf_frame, orient=tk.HORIZONTAL, command=self.scroll_x)
+        v_scrollbar = ttk.Scrollbar(self.pdf_frame, orient=tk.VERTICAL, command=self.scroll_y)
         
         # 配置画布滚动
         self.pdf_canvas.configure(xscrollcommand=h_scrollbar.set, yscrollcommand=v_scrollbar.set)
@@ -66,6 +115,9 @@ class ExamWindow:
         h_scrollbar.grid(row=1, column=0, sticky="ew")
         v_scrollbar.grid(row=0, column=1, sticky="ns")
         
+        # 窗口大小变化后补充渲染新露出的区域，适应模式下重新计算缩放
+        self.pdf_canvas.bind("<Configure>", self.on_canvas_resize)
+        
         # 配置网格权重
         self.pdf_frame.grid_rowconfigure(0, weight=1)
         self.pdf_frame.grid_columnconfigure(0, weight=1)
@@ -96,59 +148,292 @@ class ExamWindow:
 
     def zoom_in(self):
         """放大"""
-        self.zoom_level *= 1.2
-        self.show_current_page()
+        self.fit_mode = None
+        self.set_zoom(self.zoom_level * 1.2)
     
     def zoom_out(self):
         """缩小"""
-        self.zoom_level /= 1.2
-        self.show_current_page()
+        self.fit_mode = None
+        self.set_zoom(self.zoom_level / 1.2)
+
+    def set_fit_mode(self, fit_mode):
+        """按画布尺寸缩放当前页面或题目，之后翻页和改变窗口大小时保持"""
+        self.fit_mode = fit_mode
+        self.set_zoom(self.fit_zoom())
+
+    def fit_zoom(self):
+        """适应模式下使当前画面恰好放入画布的缩放级别"""
+        rect = self.page_renderer.page_rect(self.current_page)
+        if self.current_clip is not None:
+            rect = fitz.Rect(self.current_clip) & rect
+        # 留出一个像素，避免取整后刚好超出画布而出现滚动条
+        zoom = (max(self.pdf_canvas.winfo_width(), 2) - 1) / page_scale(1) / rect.width
+        if self.fit_mode == 'page':
+            zoom = min(zoom, (max(self.pdf_canvas.winfo_height(), 2) - 1) / page_scale(1) / rect.height)
+        return zoom
+
+    def on_canvas_resize(self, event):
+        """画布尺寸变化：适应模式下立即按新尺寸显示预览，停止变化后再清晰渲染"""
+        self.schedule_tile_update()
+        size = (event.width, event.height)
+        if size == self._canvas_size:
+            return
+        self._canvas_size = size
+        if self.fit_mode and self.renderer:
+            zoom_level = self.fit_zoom()
+            if zoom_key(zoom_level) != zoom_key(self.zoom_level):
+                self.set_zoom(zoom_level)
+
+    def set_zoom(self, zoom_level):
+        """立即按新的缩放显示预览，停止缩放一段时间后再清晰渲染"""
+        self.zoom_level = zoom_level
+        if self._zoom_settle:
+            self.window.after_cancel(self._zoom_settle)
+            self._zoom_settle = None
+        
+        self.page_size = self.tile_page_size()
+        if self.page_size:
+            self.pdf_canvas.configure(scrollregion=(0, 0) + self.page_size)
+        if not self.missing_jobs():
+            # 该缩放下的渲染结果都已缓存，直接显示
+            self.show_current_page()
+            return
+        
+        # 连续点击期间只更新预览，并作废进行中的清晰渲染和预取
+        self.renderer.cancel()
+        if self.prefetcher:
+            self.prefetcher.cancel()
+        self._pending = None
+        self.show_preview()
+        self._zoom_settle = self.window.after(ZOOM_SETTLE_MS, self.show_current_page)
 
     def show_current_page(self):
-        """显示当前页"""
+        """显示当前页
+
+        所需的图片都已缓存时直接显示；否则先显示低分辨率预览，
+        在后台线程中清晰渲染，完成后再替换预览。
+        """
         if not hasattr(self, 'doc'):
             return
-            
-        # 清空画布
-        self.pdf_canvas.delete("all")
+        if self._zoom_settle:
+            self.window.after_cancel(self._zoom_settle)
+            self._zoom_settle = None
         
-        # 获取页面
-        page = self.doc[self.current_page]
+        # 清晰渲染当前页时暂停预取，避免与之争用文档
+        if self.prefetcher:
+            self.prefetcher.cancel()
         
-        # 获取页面尺寸
-        canvas_width = self.pdf_canvas.winfo_width()
-        canvas_height = self.pdf_canvas.winfo_height()
+        # 适应模式下各页、各题按自身尺寸缩放，只渲染画布能显示的像素
+        if self.fit_mode:
+            self.zoom_level = self.fit_zoom()
         
-        # 将PDF页面渲染为图片
-        zoom_matrix = fitz.Matrix(2 * self.zoom_level, 2 * self.zoom_level)
-        pix = page.get_pixmap(matrix=zoom_matrix)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        # 高倍缩放时整页图片过大，只按图块渲染可见区域
+        self.page_size = self.tile_page_size()
+        if self.page_size:
+            self.pdf_canvas.configure(scrollregion=(0, 0) + self.page_size)
         
-        # 保存图片引用
-        self.photo = ImageTk.PhotoImage(img)
+        jobs = self.missing_jobs()
+        if jobs:
+            self._pending = {self.job_key(job) for job in jobs}
+            self.renderer.schedule(jobs)
+            self.show_preview()
+        else:
+            self.renderer.cancel()
+            self._pending = None
+            self.display_page()
         
-        # 在画布上显示图片
-        self.pdf_canvas.create_image(0, 0, anchor="nw", image=self.photo)
+        # 更新标题
+        question_number = self.views[self.view_index][2] if self.views else None
+        if self.current_clip is not None:
+            self.window.title(f"考试界面 - 第{question_number}题（{self.view_index + 1}/{len(self.views)}）")
+        else:
+            self.window.title(f"考试界面 - 第{self.current_page + 1}/{self.total_pages}页")
         
-        # 更新画布的滚动区域
-        self.pdf_canvas.configure(scrollregion=self.pdf_canvas.bbox("all"))
+        # 自动设置当前题号，整页显示时取本页的第一题；本页没有题目开始时取之前最后开始的题目，
+        # 第一题之前的页面或没有位置信息时留空，由考生自己填写
+        self.question_var.set("" if question_number is None else str(question_number))
+
+    def display_page(self):
+        """用清晰的渲染结果显示当前页，随后预取相邻页面"""
+        # 清空画布
+        self.pdf_canvas.delete("all")
+        self.tile_photos = {}
         
-        # 更新标题
-        self.window.title(f"考试界面 - 第{self.current_page + 1}/{self.total_pages}题")
+        if self.page_size:
+            self.photo = None
+            self.update_tiles()
+        else:
+            # 优先使用缓存的渲染结果，并保存图片引用
+            self.photo = self.get_photo(self.current_page, self.zoom_level, None, self.current_clip)
+            
+            # 在画布上显示图片
+            self.pdf_canvas.create_image(0, 0, anchor="nw", image=self.photo)
+            
+            # 更新画布的滚动区域
+            self.pdf_canvas.configure(scrollregion=self.pdf_canvas.bbox("all"))
+        
+        self.prefetch_neighbours()
+
+    def show_preview(self):
+        """把低分辨率渲染拉伸到当前缩放，只显示可见区域，作为清晰渲染完成前的预览"""
+        preview = self.get_preview(self.current_page)
+        width, height = self.page_renderer.page_pixel_size(self.current_page, self.zoom_level, self.current_clip)
+        # 按题显示时画面是整页中的一块，预览从整页拉伸结果中取相应位置
+        full_width, full_height = self.page_renderer.page_pixel_size(self.current_page, self.zoom_level)
+        dx, dy = self.page_renderer.pixel_offset(self.current_page, self.zoom_level, self.current_clip)
+        
+        canvas = self.pdf_canvas
+        canvas.delete("all")
+        self.tile_photos = {}
+        canvas.configure(scrollregion=(0, 0, width, height))
+        
+        x0 = min(max(0, int(canvas.canvasx(0))), width - 1)
+        y0 = min(max(0, int(canvas.canvasy(0))), height - 1)
+        x1 = min(width, x0 + max(canvas.winfo_width(), 1))
+        y1 = min(height, y0 + max(canvas.winfo_height(), 1))
+        region = (x0 + dx, y0 + dy, min(full_width, x1 + dx), min(full_height, y1 + dy))
+        self.photo = self.to_photo(
+            self.page_renderer.scale_region(preview, (full_width, full_height), region))
+        canvas.create_image(x0, y0, anchor="nw", image=self.photo)
+
+    def get_preview(self, page_number):
+        """当前页的低分辨率渲染，同样放入渲染缓存"""
+        key = (page_number, zoom_key(PREVIEW_ZOOM), 'preview')
+        preview = self.render_cache.get(key)
+        if preview is None:
+            preview = self.page_renderer.preview_pixmap(page_number, PREVIEW_ZOOM)
+            self.render_cache.put(key, preview, preview.width * preview.height * 3)
+        return preview
+
+    def tile_page_size(self):
+        """图块模式下当前页的像素尺寸，整页模式返回 None"""
+        if self.zoom_level >= TILE_ZOOM:
+            return self.page_renderer.page_pixel_size(self.current_page, self.zoom_level, self.current_clip)
+        return None
+
+    def visible_tiles(self, page_size):
+        """可见区域及其周围一圈的图块"""
+        canvas = self.pdf_canvas
+        x0, y0 = canvas.canvasx(0) - TILE_SIZE, canvas.canvasy(0) - TILE_SIZE
+        x1 = canvas.canvasx(canvas.winfo_width()) + TILE_SIZE
+        y1 = canvas.canvasy(canvas.winfo_height()) + TILE_SIZE
+        return tiles_in_region(page_size, x0, y0, x1, y1)
+
+    def missing_jobs(self):
+        """显示当前画面还需要渲染的 (页码, 缩放, 图块, 裁剪区域) 任务"""
+        tiles = self.visible_tiles(self.page_size) if self.page_size else [None]
+        return [
+            (self.current_page, self.zoom_level, tile, self.current_clip) for tile in tiles
+            if self.job_key((self.current_page, self.zoom_level, tile, self.current_clip)) not in self.render_cache
+        ]
+
+    @staticmethod
+    def job_key(job):
+        """渲染任务对应的缓存键，各题的裁剪区域分别缓存"""
+        page_number, zoom_level, tile, clip = job
+        return (page_number, zoom_key(zoom_level), tile, clip)
+
+    def update_tiles(self):
+        """渲染并显示可见区域及其周围尚未显示的图块"""
+        self._tile_update = None
+        # 预览显示期间由之后的清晰渲染负责补齐
+        if not self.page_size or self._pending is not None or self._zoom_settle:
+            return
+        for tile in self.visible_tiles(self.page_size):
+            if tile in self.tile_photos:
+                continue
+            # 保存图片引用，避免缓存淘汰后正在显示的图块消失
+            photo = self.tile_photos[tile] = self.get_photo(self.current_page, self.zoom_level, tile,
+                                                            self.current_clip)
+            self.pdf_canvas.create_image(tile[0] * TILE_SIZE, tile[1] * TILE_SIZE, anchor="nw", image=photo)
+
+    def schedule_tile_update(self, event=None):
+        """滚动或改变窗口大小后，在空闲时补充渲染新露出的图块"""
+        if self._tile_update is None:
+            self._tile_update = self.window.after_idle(self.update_tiles)
+
+    def scroll_x(self, *args):
+        self.pdf_canvas.xview(*args)
+        self.schedule_tile_update()
+
+    def scroll_y(self, *args):
+        self.pdf_canvas.yview(*args)
+        self.schedule_tile_update()
+
+    def get_photo(self, page_number, zoom_level, tile=None, clip=None):
+        """取缓存的图片，未缓存时渲染并放入缓存"""
+        key = self.job_key((page_number, zoom_level, tile, clip))
+        photo = self.render_cache.get(key)
+        if photo is None:
+            photo = self.render_page(page_number, zoom_level, tile, clip)
+            self.cache_photo(key, photo)
+        return photo
+
+    def render_page(self, page_number, zoom_level, tile=None, clip=None):
+        """将PDF页面或题目区域（或其中一个图块）渲染为可显示的图片"""
+        return self.to_photo(self.page_renderer.render(page_number, zoom_level, tile, clip))
+
+    def to_photo(self, data):
+        """把 PPM 或 PNG 数据交给 Tk 显示，不经过 PIL 转换"""
+        return tk.PhotoImage(master=self.window, data=data, format='PPM' if data[:2] == b'P6' else 'PNG')
+
+    def cache_photo(self, key, photo):
+        """缓存可显示的图片，Tk 按每像素4字节保存图片"""
+        self.render_cache.put(key, photo, photo.width() * photo.height() * 4)
+
+    def prefetch_neighbours(self):
+        """在后台渲染当前画面前后尚未缓存的页面或题目，取代之前的预取
+
+        图块模式下只预取翻到时最先显示的左上区域。
+        """
+        if not self.prefetcher:
+            return
+        jobs = []
+        for index in neighbour_pages(self.view_index, len(self.views), self.prefetch_pages):
+            page_number, clip, _ = self.views[index]
+            if self.page_size:
+                size = self.page_renderer.page_pixel_size(page_number, self.zoom_level, clip)
+                tiles = tiles_in_region(size, 0, 0, self.pdf_canvas.winfo_width(), self.pdf_canvas.winfo_height())
+            else:
+                tiles = [None]
+            jobs.extend(
+                (page_number, self.zoom_level, tile, clip) for tile in tiles
+                if self.job_key((page_number, self.zoom_level, tile, clip)) not in self.render_cache
+            )
+        self.prefetcher.schedule(jobs)
+
+    def poll_renders(self):
+        """在 Tk 线程中把后台渲染好的图片放入缓存，当前页渲染完成后替换预览"""
+        for worker in (self.renderer, self.prefetcher):
+            if not worker:
+                continue
+            for job, data in worker.poll():
+                key = self.job_key(job)
+                if data is not None and key not in self.render_cache:
+                    self.cache_photo(key, self.to_photo(data))
+                if worker is self.renderer and self._pending:
+                    # 渲染失败的任务在显示时于前台重新渲染
+                    self._pending.discard(key)
         
-        # 自动设置当前题号
-        self.question_var.set(str(self.current_page + 1))
+        if self._pending is not None and not self._pending:
+            self._pending = None
+            self.display_page()
+        self._render_poll = self.window.after(RENDER_POLL_MS, self.poll_renders)
+
+    def stop_rendering(self):
+        """停止后台渲染和相关的定时任务"""
+        for after_id in (self._tile_update, self._zoom_settle, self._render_poll):
+            if after_id:
+                self.window.after_cancel(after_id)
+        self._tile_update = self._zoom_settle = self._render_poll = None
+        for worker in (self.renderer, self.prefetcher):
+            if worker:
+                worker.stop()
+        self.renderer = self.prefetcher = None
 
     def load_exam_info(self):
         """加载考试信息"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT name, file_path, duration
-            FROM exams 
-            WHERE id = ?
-        """, (self.exam_id,))
-        
-        self.exam_name, self.file_path, self.duration = cursor.fetchone()
+        self.exam_name, self.file_path, self.duration = self.repository.get_exam_info(self.exam_id)
         self.remaining_minutes = self.duration
     
     def load_pdf(self):
@@ -156,22 +441,93 @@ class ExamWindow:
         try:
             self.doc = fitz.open(self.file_path)
             self.total_pages = len(self.doc)
+            # 每页的显示列表只解析一次，之后各种缩放和图块都从中渲染
+            pdf_hash = file_sha256(self.file_path) if self.use_disk_cache or self.use_pyramid else None
+            disk_cache = RenderDiskCache() if self.use_disk_cache else None
+            # 导入时预先渲染的图片，其他缩放级别仍现场渲染
+            pyramid = PagePyramid.load(pdf_hash) if self.use_pyramid else None
+            self.page_renderer = PageRenderer(self.doc, self.display_lists, disk_cache, pdf_hash, pyramid)
+            self.renderer = RenderWorker(self.page_renderer.render)
+            if self.prefetch_pages > 0:
+                self.prefetcher = RenderWorker(self.page_renderer.render, name='page-prefetch')
+            self.poll_renders()
         except Exception as e:
             messagebox.showerror("错误", f"无法加载PDF文件：{str(e)}")
             self.window.destroy()
     
+    def load_question_views(self):
+        """按提取时记录的页码和位置划分各题区域，没有位置信息时只能整页显示"""
+        if not hasattr(self, 'doc'):
+            return
+        questions = self.repository.get_question_positions(self.exam_id)
+        page_rects = [self.page_renderer.page_rect(i) for i in range(self.total_pages)]
+        self.question_views = [
+            (page_index, clip, number) for number, page_index, clip in question_regions(questions, page_rects)
+        ]
+        if not self.question_views:
+            self.question_mode = False
+            self.mode_button.configure(state=tk.DISABLED)
+        self.set_views()
+
+    def set_views(self, page_number=0):
+        """按当前显示方式生成画面列表，并定位到 page_number 页的第一个画面"""
+        if self.question_mode:
+            self.views = self.question_views
+        else:
+            self.views = [(p, None, number) for p, number in enumerate(self.page_questions())]
+        self.mode_button.configure(text="整页显示" if self.question_mode else "按题显示")
+        index = next((i for i, view in enumerate(self.views) if view[0] >= page_number), len(self.views) - 1)
+        self.go_to_view(max(index, 0))
+
+    def page_questions(self):
+        """整页显示时各页对应的题号：本页开始的第一题，本页没有题目开始时为之前最后开始的题目，
+        第一题之前的页面为 None"""
+        starts = sorted((page_index, clip[1], number) for page_index, clip, number in self.question_views)
+        numbers = []
+        current = None
+        i = 0
+        for page_index in range(self.total_pages):
+            first = None
+            while i < len(starts) and starts[i][0] == page_index:
+                if first is None:
+                    first = starts[i][2]
+                current = starts[i][2]
+                i += 1
+            numbers.append(first if first is not None else current)
+        return numbers
+
+    def go_to_view(self, index):
+        """切换到第 index 个画面"""
+        self.view_index = index
+        if self.views:
+            self.current_page, self.current_clip, _ = self.views[index]
+
+    def toggle_question_mode(self):
+        """在按题显示和整页显示之间切换，停留在当前页"""
+        self.question_mode = not self.question_mode
+        self.set_views(self.current_page)
+        self.scroll_to_top()
+        self.show_current_page()
+
     def prev_page(self):
-        """上一页"""
-        if self.current_page > 0:
-            self.current_page -= 1
+        """上一题（整页显示时为上一页）"""
+        if self.view_index > 0:
+            self.go_to_view(self.view_index - 1)
+            self.scroll_to_top()
             self.show_current_page()
     
     def next_page(self):
-        """下一页"""
-        if self.current_page < self.total_pages - 1:
-            self.current_page += 1
+        """下一题（整页显示时为下一页）"""
+        if self.view_index < len(self.views) - 1:
+            self.go_to_view(self.view_index + 1)
+            self.scroll_to_top()
             self.show_current_page()
     
+    def scroll_to_top(self):
+        """翻页后从新页面的左上角开始显示"""
+        self.pdf_canvas.xview_moveto(0)
+        self.pdf_canvas.yview_moveto(0)
+    
     def submit_answer(self):
         """提交答案"""
         question_num = self.question_var.get().strip()
@@ -210,53 +566,39 @@ class ExamWindow:
             
         try:
             # 获取标准答案
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT question_number, correct_answer, score
-                FROM answers
-                WHERE exam_id = ?
-            """, (self.exam_id,))
-            
-            correct_answers = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+            correct_answers = self.repository.get_answer_key(self.exam_id)
             
-            # 计算得分
-            total_score = 0
-            for question_num, answer in self.student_answers.items():
-                if question_num in correct_answers:
-                    correct_answer, score = correct_answers[question_num]
-                    if answer.upper() == correct_answer.upper():
-                        total_score += score
+            # 逐题评分
+            graded = grade_by_number(self.student_answers, correct_answers)
             
-            # 保存考试记录
-            cursor.execute("""
-                INSERT INTO exam_records (
-                    exam_id, student_name, start_time,
-                    end_time, answers, score
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, (
+            # 保存考试记录和逐题评分结果
+            self.repository.record_submission(
                 self.exam_id,
                 "匿名考生",  # 可以添加输入考生姓名的功能
                 self.start_time.strftime('%Y-%m-%d %H:%M:%S'),
                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                json.dumps(self.student_answers),
-                total_score
-            ))
-            
-            self.conn.commit()
+                self.student_answers,
+                graded
+            )
             
             # 显示得分
-            messagebox.showinfo("考试结束", f"您的得分是：{total_score}分")
+            messagebox.showinfo("考试结束", f"您的得分是：{total_score(graded)}分")
             
         except Exception as e:
             messagebox.showerror("错误", f"保存考试记录失败：{str(e)}")
         finally:
-            self.doc.close()
-            self.conn.close()
+            self.stop_rendering()
+            self.render_cache.clear()
+            self.page_renderer.clear()
+            with FITZ_LOCK:
+                self.doc.close()
             self.window.destroy()
     
     def __del__(self):
         """清理资源"""
+        for worker in (getattr(self, 'renderer', None), getattr(self, 'prefetcher', None)):
+            if worker:
+                worker.stop()
         if hasattr(self, 'doc'):
-            self.doc.close()
-        if hasattr(self, 'conn'):
-            self.conn.close()
+            with FITZ_LOCK:
+                self.doc.close()
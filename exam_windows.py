@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
 import json
+from grading import grade_by_question, total_score
+from repository import get_repository
 
 class ExamWindow:
     def __init__(self, parent, exam_id):
@@ -16,7 +17,7 @@ class ExamWindow:
         self.questions = []
         
         # 从数据库加载试卷信息
-        self.conn = sqlite3.connect('gespexam.db')
+        self.repository = get_repository()
         self.load_exam_info()
         
         # 创建界面
@@ -24,20 +25,11 @@ class ExamWindow:
         
     def load_exam_info(self):
         """加载试卷信息和题目"""
-        cursor = self.conn.cursor()
-        
         # 获取试卷信息
-        cursor.execute("SELECT name FROM exams WHERE id = ?", (self.exam_id,))
-        self.exam_name = cursor.fetchone()[0]
+        self.exam_name = self.repository.get_exam_info(self.exam_id)[0]
         
         # 获取所有题目
-        cursor.execute("""
-            SELECT id, question_type, question_text, options, correct_answer, question_number, score
-            FROM questions
-            WHERE exam_id = ?
-            ORDER BY question_number
-        """, (self.exam_id,))
-        self.questions = cursor.fetchall()
+        self.questions = self.repository.get_questions(self.exam_id)
         
     def create_widgets(self):
         """创建界面组件"""
@@ -158,37 +150,20 @@ class ExamWindow:
         if not messagebox.askyesno("确认", "确定要提交试卷吗？"):
             return
             
-        # 计算得分
-        total_score = 0
-        for question in self.questions:
-            q_id, q_type, _, _, correct, _, score = question
-            if q_id in self.answers:
-                answer = self.answers[q_id]
-                if q_type in ('single_choice', 'true_false'):
-                    if str(answer).lower() == str(correct).lower():
-                        total_score += score
-                # 编程题需要人工评分，这里暂不计分
-        
-        # 保存考试结果
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO exam_results (exam_id, student_name, end_time, total_score, answers)
-            VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?)
-        """, (
+        # 逐题评分，编程题需要人工评分，这里暂不计分
+        graded = grade_by_question(self.answers, self.questions)
+        
+        # 保存考试结果和逐题评分结果
+        self.repository.record_result(
             self.exam_id,
             "匿名学生",  # 这里可以添加输入学生姓名的功能
-            total_score,
-            json.dumps(self.answers)
-        ))
-        self.conn.commit()
+            self.answers,
+            graded
+        )
         
         # 显示得分
-        messagebox.showinfo("考试完成", f"您的得分是：{total_score}分")
+        messagebox.showinfo("考试完成", f"您的得分是：{total_score(graded)}分")
         self.window.destroy()
-        
-    def __del__(self):
-        """关闭数据库连接"""
-        self.conn.close()
 
 class AddQuestionsWindow:
     def __init__(self, parent, exam_id, main_gui):
@@ -199,7 +174,7 @@ class AddQuestionsWindow:
         
         self.exam_id = exam_id
         self.main_gui = main_gui
-        self.conn = sqlite3.connect('gespexam.db')
+        self.repository = get_repository()
         
         self.create_widgets()
         
@@ -297,28 +272,8 @@ class AddQuestionsWindow:
                 if answer not in options:
                     raise ValueError("正确答案必须是选项之一")
             
-            # 获取当前题号
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM questions WHERE exam_id = ?", (self.exam_id,))
-            question_number = cursor.fetchone()[0] + 1
-            
-            # 保存题目
-            cursor.execute("""
-                INSERT INTO questions (
-                    exam_id, question_type, question_text,
-                    options, correct_answer, question_number, score
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                self.exam_id,
-                q_type,
-                q_text,
-                json.dumps(options) if options else None,
-                answer,
-                question_number,
-                score
-            ))
-            
-            self.conn.commit()
+            # 保存题目，题号排在最后
+            self.repository.add_question(self.exam_id, q_type, q_text, options, answer, score=score)
             
             # 更新主界面
             self.main_gui.load_exams()
@@ -335,7 +290,3 @@ class AddQuestionsWindow:
             messagebox.showerror("错误", str(e))
         except Exception as e:
             messagebox.showerror("错误", f"保存失败: {str(e)}")
-            
-    def __del__(self):
-        """关闭数据库连接"""
-        self.conn.close()
@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from instrumentation import get_logger
+
+logger = get_logger('cache')
+
+
+def file_sha256(path) -> str:
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    """把 [0, page_count) 均分为不超过 parts 段连续页范围，供多进程按页范围并行处理"""
+    parts = min(parts, page_count)
+    if parts <= 0:
+        return []
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def write_atomic(path, data: bytes):
+    """先写同目录下的临时文件再原子替换，读取方和并行的写入方不会看到写了一半的文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class FileCache:
+    """基于目录的持久缓存
+
+    每个键对应一个文件，写入时先写临时文件再原子替换。
+    读取命中会刷新文件的修改时间，超出容量时按修改时间淘汰最久未使用的条目。
+
+    写入时不扫描目录：占用的字节数只在第一次写入时统计一次，之后按本进程的写入累加，
+    估计值超出容量时才扫描目录淘汰，另外每写入 RESCAN_INTERVAL 次重新扫描一次，计入其他进程的写入。
+    """
+
+    # 每写入多少次重新扫描目录
+    RESCAN_INTERVAL = 256
+    # 淘汰到容量的这一比例，之后的写入不会立即再次触发扫描
+    EVICT_RATIO = 0.9
+
+    def __init__(self, directory, max_bytes: int, suffix: str = '.bin'):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # 占用字节数的估计值，None 表示需要重新扫描；渲染线程和界面线程都会写入
+        self._total: Optional[int] = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> Path:
+        """键对应的缓存文件路径"""
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取缓存，未命中返回 None"""
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # 标记为最近使用
+        except OSError:
+            # 只读的共享目录仍可读取
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        """写入缓存，估计的占用超出容量时淘汰旧条目"""
+        write_atomic(self.path_for(key), data)
+        self._added(len(data))
+
+    def open_writer(self, key: str) -> 'CacheWriter':
+        """分多次写入一个条目，commit 后才可见"""
+        return CacheWriter(self, key)
+
+    def _added(self, size: int):
+        """记录新写入的条目，估计的占用超出容量时淘汰旧条目"""
+        with self._lock:
+            self._puts += 1
+            if self._total is None or self._puts % self.RESCAN_INTERVAL == 0:
+                self._total = None
+            else:
+                # 覆盖已有条目时略微高估，超出容量时的扫描会校正
+                self._total += size
+            if self._total is None or self._total > self.max_bytes:
+                self._total = self._evict()
+
+    def delete(self, key: str):
+        """删除单个条目"""
+        try:
+            self.path_for(key).unlink()
+        except OSError:
+            pass
+        self._total = None
+
+    def delete_matching(self, pattern: str):
+        """删除文件名匹配通配符的条目"""
+        for path in self.directory.glob(f"{pattern}{self.suffix}"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self._total = None
+
+    def clear(self):
+        """清空缓存"""
+        self.delete_matching('*')
+
+    def size(self) -> int:
+        """当前缓存占用的字节数"""
+        return sum(entry['size'] for entry in self._entries())
+
+    def _entries(self) -> List[Dict]:
+        entries = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                # 可能已被其他进程淘汰
+                continue
+            entries.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+        return entries
+
+    def _evict(self) -> int:
+        """扫描目录，超出容量时按最近使用时间从旧到新删除到 EVICT_RATIO，返回剩余的字节数"""
+        entries = self._entries()
+        total = sum(entry['size'] for entry in entries)
+        if total <= self.max_bytes:
+            return total
+
+        target = self.max_bytes * self.EVICT_RATIO
+        entries.sort(key=lambda entry: entry['mtime'])
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                entry['path'].unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # 只读目录或文件被占用（Windows），保留该条目
+                continue
+            total -= entry['size']
+        return total
+
+
+class CacheWriter:
+    """流式写入一个缓存条目：先写同目录下的临时文件，commit 时原子替换
+
+    未 commit 就 close 时删除临时文件，不产生缓存条目。
+    """
+
+    def __init__(self, cache: FileCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=cache.directory, suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data: bytes):
+        """追加数据"""
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """完成写入，条目可被读取"""
+        self._file.close()
+        os.replace(self._tmp_path, self.cache.path_for(self.key))
+        self._tmp_path = None
+        self.cache._added(self.size)
+
+    def close(self):
+        """结束写入，未提交时丢弃已写入的数据"""
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        if self._tmp_path is not None:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+            self._tmp_path = None
+
+
+class QuestionWriter:
+    """逐题写入题目列表缓存，写出的内容与 put_questions 的格式相同
+
+    缓存只用于加速，写入或提交失败时记录日志并放弃这个条目，不影响提取。
+    """
+
+    def __init__(self, writer: CacheWriter):
+        self.writer = writer
+        self.count = 0
+        self.failed = False
+
+    def add(self, question: Dict):
+        """追加一道题"""
+        if not self.failed:
+            self._write((b',' if self.count else b'[') + json.dumps(question, ensure_ascii=False).encode('utf-8'))
+            self.count += 1
+
+    def commit(self):
+        """写入结尾并提交"""
+        if self.failed:
+            return
+        self._write(b']' if self.count else b'[]')
+        if not self.failed:
+            try:
+                self.writer.commit()
+            except OSError as e:
+                self._fail(e)
+
+    def _write(self, data: bytes):
+        try:
+            self.writer.write(data)
+        except OSError as e:
+            self._fail(e)
+
+    def _fail(self, error: OSError):
+        logger.warning("写入提取缓存失败 %s: %s", self.writer.key, error)
+        self.failed = True
+        self.close()
+
+    def close(self):
+        """结束写入，未提交时丢弃"""
+        self.writer.close()
+
+
+class ExtractionCache(FileCache):
+    """题目提取结果缓存，键为 PDF内容SHA-256 + 提取器名称 + 提取器版本"""
+
+    def __init__(self, directory='exam_data/cache/extraction', max_bytes: int = 50 * 1024 * 1024):
+        super().__init__(directory, max_bytes, suffix='.json')
+
+    def key_for(self, pdf_path: str, extractor: str, version) -> str:
+        """生成缓存键"""
+        return f"{file_sha256(pdf_path)}-{extractor}-v{version}"
+
+    def get_questions(self, key: str) -> Optional[List[Dict]]:
+        """读取缓存的题目列表"""
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            # 损坏的条目直接丢弃
+            self.delete(key)
+            return None
+
+    def put_questions(self, key: str, questions: List[Dict]):
+        """缓存题目列表，写入失败（如只读的共享目录）时记录日志后忽略"""
+        try:
+            self.put(key, json.dumps(questions, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            logger.warning("写入提取缓存失败 %s: %s", key, e)
+
+    def question_writer(self, key: str) -> Optional[QuestionWriter]:
+        """逐题写入题目列表，不需要在内存中保留整份试卷的题目；无法创建临时文件时返回 None"""
+        try:
+            return QuestionWriter(self.open_writer(key))
+        except OSError as e:
+            logger.warning("写入提取缓存失败 %s: %s", key, e)
+            return None
+
+    def invalidate(self, pdf_path: str):
+        """删除某个PDF的所有提取结果（所有提取器和版本）"""
+        self.delete_matching(f"{file_sha256(pdf_path)}-*")
+
+
+class RenderDiskCache(FileCache):
+    """渲染好的页面图片缓存（PNG），键为 PDF内容SHA-256 + 页码 + 缩放 + 图块 + 裁剪区域
+
+    多台考试机共享同一 exam_data 时，同一试卷的页面只需渲染一次。
+    """
+
+    def __init__(self, directory='exam_data/cache/render', max_bytes: int = 500 * 1024 * 1024):
+        super().__init__(directory, max_bytes, suffix='.png')
+
+    def key_for(self, pdf_hash: str, page_number: int, zoom_level: float,
+                tile: Optional[Tuple[int, int, int]] = None,
+                clip: Optional[Tuple[float, float, float, float]] = None) -> str:
+        """生成缓存键，tile 为 (图块边长, 列, 行)，clip 为页面坐标中的裁剪区域
+
+        缩放按千分位取整，连续放大缩小产生的浮点误差落在同一个键上。
+        """
+        key = f"{pdf_hash}-p{page_number}-z{round(zoom_level, 3):.3f}"
+        if tile is not None:
+            key += "-t{}_{}_{}".format(*tile)
+        if clip is not None:
+            key += "-c" + "_".join(f"{v:.1f}" for v in clip)
+        return key
+
+    def invalidate(self, pdf_hash: str):
+        """删除某个PDF的所有渲染结果"""
+        self.delete_matching(f"{pdf_hash}-*")
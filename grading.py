@@ -0,0 +1,51 @@
+"""评分规则
+
+两种考试界面提交时都用这里的函数逐题评分（迁移回填历史记录使用 migrations.py 中固定的规则），
+结果为 (题目ID, 题号, 答案, 是否正确, 得分) 列表，写入 record_answers 表。
+整卷考试界面按题号作答，题目ID为 None；不能自动评分的题目“是否正确”和“得分”为 None。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GradedAnswer = Tuple[Optional[int], int, str, Optional[int], Optional[int]]
+
+# 逐题考试界面自动评分的题型，编程题需要人工评分
+AUTO_GRADED_TYPES = ('single_choice', 'true_false')
+
+
+def grade_by_number(answers: Dict, answer_key: Dict[int, Tuple[str, int]]) -> List[GradedAnswer]:
+    """整卷考试界面：answers 以题号为键，与标准答案 {题号: (答案, 分值)} 比较，不区分大小写"""
+    graded = []
+    for number, answer in answers.items():
+        number = int(number)
+        if number in answer_key:
+            correct_answer, score = answer_key[number]
+            correct = str(answer).upper() == str(correct_answer).upper()
+            graded.append((None, number, answer, int(correct), score if correct else 0))
+        else:
+            graded.append((None, number, answer, None, None))
+    return graded
+
+
+def grade_by_question(answers: Dict, questions: Iterable[Tuple]) -> List[GradedAnswer]:
+    """逐题考试界面：answers 以题目ID为键，questions 为 repository.QUESTION_COLUMNS 各列
+
+    题号可能重复（如手工添加题目后），结果保留题目ID区分各题。
+    """
+    by_id = {question[0]: question for question in questions}
+    graded = []
+    for q_id, answer in answers.items():
+        question = by_id.get(int(q_id))
+        if question is None:
+            continue
+        question_id, q_type, _, _, correct_answer, number, score = question
+        if q_type in AUTO_GRADED_TYPES:
+            correct = str(answer).lower() == str(correct_answer).lower()
+            graded.append((question_id, number, answer, int(correct), score if correct else 0))
+        else:
+            graded.append((question_id, number, answer, None, None))
+    return graded
+
+
+def total_score(graded: Iterable[GradedAnswer]) -> int:
+    """总分，未评分的题目不计分"""
+    return sum(score or 0 for *_, score in graded)
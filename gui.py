@@ -1,12 +1,17 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-import sqlite3
 import os
 from pathlib import Path
 import shutil
 import json
+import threading
 from datetime import datetime
 from exam_window import ExamWindow
+from instrumentation import get_logger
+from page_pyramid import build_pyramid
+from repository import close_repositories, get_repository
+
+logger = get_logger('gui')
 
 class GespexamGUI:
     def __init__(self, root):
@@ -16,29 +21,12 @@ class GespexamGUI:
         # 设置窗口大小
         self.root.geometry("800x600")
         
-        # 初始化数据库连接
-        self.conn = sqlite3.connect('gespexam.db')
-        self.create_tables()
+        # 与考试窗口共用的数据访问层（打开时创建缺少的表）
+        self.repository = get_repository()
         
         # 创建主界面
         self.create_main_interface()
     
-    def create_tables(self):
-        """创建数据库表"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS exams (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                original_filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_type TEXT NOT NULL,
-                upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                duration INTEGER DEFAULT 120
-            )
-        ''')
-        self.conn.commit()
-    
     def create_main_interface(self):
         """创建主界面"""
         # 创建工具栏
@@ -88,14 +76,7 @@ class GespexamGUI:
         for item in self.exam_tree.get_children():
             self.exam_tree.delete(item)
         
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, name, upload_time, duration
-            FROM exams 
-            ORDER BY upload_time DESC
-        """)
-        
-        for row in cursor.fetchall():
+        for row in self.repository.list_exams():
             self.exam_tree.insert('', 'end', values=row)
     
     def upload_exam(self):
@@ -126,24 +107,26 @@ class GespexamGUI:
             shutil.copy2(file_path, new_path)
             
             # 保存到数据库
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO exams (name, original_filename, file_path, file_type)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                original_filename,
-                original_filename,
-                str(new_path),
-                file_type
-            ))
-            
-            self.conn.commit()
+            self.repository.add_exam(original_filename, original_filename, str(new_path), file_type)
             self.load_exams()
+            # 在后台预先渲染各页图片，完成前打开的考试窗口会现场渲染
+            threading.Thread(target=self.build_pyramid, args=(new_path,), daemon=True).start()
             messagebox.showinfo("成功", "试卷上传成功！")
             
         except Exception as e:
             messagebox.showerror("错误", f"上传失败: {str(e)}")
     
+    def build_pyramid(self, file_path):
+        """后台线程：预先渲染试卷页面，失败时只影响打开试卷的速度
+
+        在界面进程内逐页渲染（workers=1），不占满所有核心，退出时也不会遗留进程池；
+        退出时中断的渲染没有写入清单，不会被使用，下次渲染同一试卷时继续。
+        """
+        try:
+            build_pyramid(str(file_path), workers=1)
+        except Exception as e:
+            logger.warning("预先渲染失败 %s: %s", file_path, e)
+
     def preview_exam(self):
         """预览试卷"""
         selection = self.exam_tree.selection()
@@ -154,9 +137,7 @@ class GespexamGUI:
         exam_id = self.exam_tree.item(selection[0])['values'][0]
         
         # 获取试卷文件路径
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT file_path FROM exams WHERE id = ?", (exam_id,))
-        file_path = cursor.fetchone()[0]
+        file_path = self.repository.get_exam_file(exam_id)
         
         # 使用系统默认程序打开PDF
         try:
@@ -194,14 +175,7 @@ class GespexamGUI:
         )
         
         if new_name:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                UPDATE exams 
-                SET name = ?
-                WHERE id = ?
-            """, (new_name, exam_id))
-            
-            self.conn.commit()
+            self.repository.rename_exam(exam_id, new_name)
             self.load_exams()
     
     def delete_exam(self):
@@ -217,34 +191,23 @@ class GespexamGUI:
         exam_id = self.exam_tree.item(selection[0])['values'][0]
         
         try:
-            cursor = self.conn.cursor()
-            
             # 获取文件路径
-            cursor.execute("SELECT file_path FROM exams WHERE id = ?", (exam_id,))
-            file_path = cursor.fetchone()[0]
+            file_path = self.repository.get_exam_file(exam_id)
             
             # 删除文件
             if os.path.exists(file_path):
                 os.remove(file_path)
             
             # 删除数据库记录
-            cursor.execute("DELETE FROM exams WHERE id = ?", (exam_id,))
-            cursor.execute("DELETE FROM answers WHERE exam_id = ?", (exam_id,))
-            cursor.execute("DELETE FROM exam_records WHERE exam_id = ?", (exam_id,))
-            
-            self.conn.commit()
+            self.repository.delete_exam(exam_id)
             self.load_exams()
             messagebox.showinfo("成功", "试卷删除成功！")
             
         except Exception as e:
             messagebox.showerror("错误", f"删除失败: {str(e)}")
-    
-    def __del__(self):
-        """关闭数据库连接"""
-        if hasattr(self, 'conn'):
-            self.conn.close()
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = GespexamGUI(root)
     root.mainloop()
+    close_repositories()
@@ -0,0 +1,99 @@
+"""提取过程的分级日志、阶段计时和计数
+
+日志统一使用 'gespexam' 记录器，默认不输出调试和进度信息，
+需要时调用 enable_logging() 打开。计时和计数记录在 Metrics 中，
+可以在进程之间以字典形式传递并合并，由批量导入等调用方汇总输出。
+"""
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+logger = logging.getLogger('gespexam')
+
+
+def get_logger(name: str) -> logging.Logger:
+    """返回 'gespexam' 下的子记录器"""
+    return logger.getChild(name)
+
+
+def enable_logging(level: int = logging.INFO, stream=None):
+    """把 'gespexam' 的日志按指定级别输出到 stream（默认 stderr）"""
+    if not any(getattr(h, '_gespexam', False) for h in logger.handlers):
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        handler._gespexam = True
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+class Metrics:
+    """按阶段累计耗时并记录计数
+
+    阶段可以嵌套，每个阶段只记录扣除内层阶段后的耗时，
+    因此各阶段耗时之和等于总耗时。
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        # 正在计时的各层阶段中内层阶段的累计耗时
+        self._nested = []
+
+    @contextmanager
+    def span(self, stage: str):
+        """计时一个阶段"""
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed - nested
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def time_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """逐项产出，每次取下一项的耗时计入 stage，不包括调用方处理该项的时间"""
+        iterator = iter(iterable)
+        while True:
+            with self.span(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def incr(self, name: str, count: int = 1):
+        """增加计数"""
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def merge(self, other: Union['Metrics', Dict]):
+        """合并另一份记录，可以是 Metrics 或 as_dict() 的结果"""
+        if isinstance(other, Metrics):
+            other = other.as_dict()
+        for stage, elapsed in other.get('timings', {}).items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+        for name, count in other.get('counters', {}).items():
+            self.incr(name, count)
+
+    def as_dict(self) -> Dict:
+        """可序列化、可跨进程传递的副本"""
+        return {'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+    def reset(self):
+        self.timings.clear()
+        self.counters.clear()
+
+    def format(self, title: Optional[str] = None) -> str:
+        """格式化为便于阅读的多行文本"""
+        lines = [title] if title else []
+        if self.timings:
+            lines.append("阶段耗时: " + ', '.join(
+                f"{stage} {elapsed:.2f}s" for stage, elapsed in sorted(self.timings.items())))
+        if self.counters:
+            lines.append("计数: " + ', '.join(
+                f"{name} {count}" for name, count in sorted(self.counters.items())))
+        return '\n'.join(lines)
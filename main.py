@@ -1,12 +1,11 @@
-import sqlite3
 import json
 from pathlib import Path
 import shutil
+from repository import close_repositories, get_repository
 
 class GespexamManager:
     def __init__(self):
-        self.conn = sqlite3.connect('gespexam.db')
-        self.cursor = self.conn.cursor()
+        self.repository = get_repository()
         
         # 确保PDF存储目录存在
         self.pdf_dir = Path("pdfs")
@@ -29,87 +28,34 @@ class GespexamManager:
         pdf_path = self.pdf_dir / file_path.name
         shutil.copy2(file_path, pdf_path)
         
-        self.cursor.execute("""
-            INSERT INTO exams (name, file_path, pdf_path, status)
-            VALUES (?, ?, ?, ?)
-        """, (name, str(file_path), str(pdf_path), 'pending'))
-        
-        self.conn.commit()
-        return self.cursor.lastrowid
+        return self.repository.add_exam(
+            name, file_path.name, str(file_path), file_path.suffix.lower(), str(pdf_path), 'pending')
     
     def add_question(self, exam_id, question_type, question_text, options=None, correct_answer=None, question_number=None):
         """添加题目到试卷"""
-        if question_number is None:
-            # 获取当前试卷的题目数量
-            self.cursor.execute("SELECT COUNT(*) FROM questions WHERE exam_id = ?", (exam_id,))
-            question_number = self.cursor.fetchone()[0] + 1
-        
-        self.cursor.execute("""
-            INSERT INTO questions (
-                exam_id, question_type, question_text,
-                options, correct_answer, question_number
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            exam_id,
-            question_type,
-            question_text,
-            json.dumps(options) if options else None,
-            correct_answer,
-            question_number
-        ))
-        
-        self.conn.commit()
-        return self.cursor.lastrowid
+        return self.repository.add_question(
+            exam_id, question_type, question_text, options, correct_answer, question_number)
+    
+    def add_questions(self, exam_id, questions, complete=False):
+        """批量添加题目，可直接传入 ExamParser 或 PDFExtractor 产出的题目
+
+        题号要么全部给出，要么全部省略（从已有的最大题号之后依次分配），
+        PDFExtractor 题目的页码和区域一并保存。所有题目和试卷的题目统计在一个事务中写入，
+        complete 为真时同时把试卷标记为完成。返回写入的题目数。
+        """
+        return self.repository.add_questions(exam_id, questions, complete)
     
     def get_exam(self, exam_id):
         """获取试卷信息"""
-        self.cursor.execute("""
-            SELECT id, name, file_path, pdf_path, status,
-                   total_questions, single_choice_count,
-                   true_false_count, programming_count
-            FROM exams
-            WHERE id = ?
-        """, (exam_id,))
-        return self.cursor.fetchone()
+        return self.repository.get_exam(exam_id)
     
     def get_questions(self, exam_id):
         """获取试卷的所有题目"""
-        self.cursor.execute("""
-            SELECT id, question_type, question_text,
-                   options, correct_answer, question_number
-            FROM questions
-            WHERE exam_id = ?
-            ORDER BY question_number
-        """, (exam_id,))
-        return self.cursor.fetchall()
+        return self.repository.get_questions(exam_id)
     
     def complete_exam(self, exam_id):
         """完成试卷编辑"""
-        # 获取题目统计
-        self.cursor.execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN question_type = 'single_choice' THEN 1 ELSE 0 END) as single_choice,
-                SUM(CASE WHEN question_type = 'true_false' THEN 1 ELSE 0 END) as true_false,
-                SUM(CASE WHEN question_type = 'programming' THEN 1 ELSE 0 END) as programming
-            FROM questions 
-            WHERE exam_id = ?
-        """, (exam_id,))
-        
-        counts = self.cursor.fetchone()
-        
-        # 更新试卷状态和题目数量
-        self.cursor.execute('''
-            UPDATE exams SET 
-                status = 'completed',
-                total_questions = ?,
-                single_choice_count = ?,
-                true_false_count = ?,
-                programming_count = ?
-            WHERE id = ?
-        ''', (counts[0], counts[1], counts[2], counts[3], exam_id))
-        
-        self.conn.commit()
+        self.repository.complete_exam(exam_id)
     
     def export_exam(self, exam_id, output_file):
         """导出试卷为JSON格式"""
@@ -140,10 +86,6 @@ class GespexamManager:
         # 写入文件
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(exam_data, f, ensure_ascii=False, indent=2)
-    
-    def __del__(self):
-        """关闭数据库连接"""
-        self.conn.close()
 
 # 测试代码
 if __name__ == "__main__":
@@ -159,34 +101,30 @@ if __name__ == "__main__":
     # 添加试卷
     exam_id = manager.add_exam("2025年春季Python考试", str(example_pdf))
     
-    # 添加题目
-    # 单选题示例
-    manager.add_question(
-        exam_id,
-        "single_choice",
-        "以下哪个不是Python的基本数据类型？",
-        ["int", "float", "string", "array"],
-        "array"
-    )
-    
-    # 判断题示例
-    manager.add_question(
-        exam_id,
-        "true_false",
-        "Python是一门编译型语言。",
-        correct_answer="false"
-    )
-    
-    # 编程题示例
-    manager.add_question(
-        exam_id,
-        "programming",
-        "请编写一个函数，计算斐波那契数列的第n项。",
-        correct_answer="def fibonacci(n):\n    if n <= 1:\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)"
-    )
-    
-    # 完成试卷
-    manager.complete_exam(exam_id)
+    # 批量添加题目并完成试卷，也可直接传入 PDFExtractor().iter_questions(pdf_path)
+    manager.add_questions(exam_id, [
+        # 单选题示例
+        {
+            'type': "single_choice",
+            'text': "以下哪个不是Python的基本数据类型？",
+            'options': ["int", "float", "string", "array"],
+            'correct_answer': "array"
+        },
+        # 判断题示例
+        {
+            'type': "true_false",
+            'text': "Python是一门编译型语言。",
+            'correct_answer': "false"
+        },
+        # 编程题示例
+        {
+            'type': "programming",
+            'text': "请编写一个函数，计算斐波那契数列的第n项。",
+            'correct_answer': "def fibonacci(n):\n    if n <= 1:\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)"
+        }
+    ], complete=True)
     
     # 导出试卷
     manager.export_exam(exam_id, "output/2025_spring_python.json")
+    
+    close_repositories()
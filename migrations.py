@@ -0,0 +1,312 @@
+"""数据库结构迁移
+
+数据库的结构版本保存在 PRAGMA user_version 中，migrate() 按顺序执行
+版本号更高的迁移，每个迁移和版本号的更新在同一个事务中完成，
+已有数据保持不变。修改结构时在 MIGRATIONS 末尾追加新的迁移，不要修改已发布的迁移。
+"""
+import json
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+
+from instrumentation import get_logger
+
+logger = get_logger('migrations')
+
+
+def _create_base_tables(cursor):
+    """试卷、答案、考试记录、题目、导入记录和页面指纹表（已存在的表保持不变）"""
+    # 创建试卷表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,                    -- 试卷名称
+        original_filename TEXT NOT NULL,       -- 原始文件名
+        file_path TEXT NOT NULL,              -- 文件路径
+        file_type TEXT NOT NULL,              -- 文件类型
+        upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration INTEGER DEFAULT 120           -- 考试时长(分钟)
+    )
+    ''')
+
+    # 创建答案表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        question_number INTEGER NOT NULL,     -- 题目序号
+        correct_answer TEXT NOT NULL,         -- 正确答案
+        score INTEGER DEFAULT 5,              -- 分值
+        FOREIGN KEY (exam_id) REFERENCES exams (id)
+    )
+    ''')
+
+    # 创建考试记录表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exam_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        student_name TEXT NOT NULL,           -- 考生姓名
+        start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        end_time TIMESTAMP,                   -- 结束时间
+        answers TEXT,                         -- JSON格式存储答案 {question_number: answer}
+        score INTEGER,                        -- 得分
+        FOREIGN KEY (exam_id) REFERENCES exams (id)
+    )
+    ''')
+
+    # 创建题目表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        question_number INTEGER NOT NULL,     -- 题目序号
+        question_type TEXT NOT NULL,          -- 题型
+        question_text TEXT,                   -- 题目内容
+        question_image_path TEXT,             -- JSON格式存储题目图片路径
+        options TEXT,                         -- JSON格式存储选项
+        options_image_path TEXT,              -- 选项图片路径
+        correct_answer TEXT,                  -- 正确答案
+        score INTEGER DEFAULT 10,             -- 分值
+        page_number INTEGER,                  -- 所在页码
+        bbox TEXT,                            -- JSON格式存储题目区域
+        FOREIGN KEY (exam_id) REFERENCES exams (id)
+    )
+    ''')
+
+    # 创建已导入文件表（按内容哈希去重）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingested_files (
+        file_hash TEXT PRIMARY KEY,           -- PDF内容的SHA-256
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        source_path TEXT NOT NULL,            -- 导入时的源文件路径
+        ingest_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (exam_id) REFERENCES exams (id)
+    )
+    ''')
+
+    # 创建页面指纹表（增量重新提取使用）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS page_fingerprints (
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        page_number INTEGER NOT NULL,         -- 页码
+        fingerprint TEXT NOT NULL,            -- 页面内容和资源的哈希
+        events TEXT NOT NULL,                 -- JSON格式存储该页的提取结果
+        PRIMARY KEY (exam_id, page_number),
+        FOREIGN KEY (exam_id) REFERENCES exams (id)
+    )
+    ''')
+
+
+def _add_exam_status_columns(cursor):
+    """main.py 使用的试卷状态和题型统计列"""
+    _add_column(cursor, 'exams', 'pdf_path', 'TEXT')                               # 管理程序保存的PDF副本
+    _add_column(cursor, 'exams', 'status', "TEXT DEFAULT 'pending'")               # pending / completed
+    _add_column(cursor, 'exams', 'total_questions', 'INTEGER DEFAULT 0')
+    _add_column(cursor, 'exams', 'single_choice_count', 'INTEGER DEFAULT 0')
+    _add_column(cursor, 'exams', 'true_false_count', 'INTEGER DEFAULT 0')
+    _add_column(cursor, 'exams', 'programming_count', 'INTEGER DEFAULT 0')
+
+
+def _create_exam_results(cursor):
+    """exam_windows.py 的逐题考试界面保存结果的表"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exam_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        student_name TEXT NOT NULL,           -- 考生姓名
+        start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        end_time TIMESTAMP,                   -- 结束时间
+        total_score INTEGER,                  -- 得分
+        answers TEXT,                         -- JSON格式存储答案 {question_id: answer}
+        FOREIGN KEY (exam_id) REFERENCES exams (id)
+    )
+    ''')
+
+
+def _create_indexes(cursor):
+    """常用查询的索引；answers 的索引包含评分查询需要的所有列，查询只读索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_answers_exam "
+                   "ON answers (exam_id, question_number, correct_answer, score)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_records_exam ON exam_records (exam_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_results_exam ON exam_results (exam_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_exam_number ON questions (exam_id, question_number)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exams_upload_time ON exams (upload_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingested_files_exam ON ingested_files (exam_id)")
+
+
+def _create_record_answers(cursor):
+    """逐题作答表，并从 exam_records 和 exam_results 的JSON答案回填
+
+    历史记录只保存了答案，回填时按迁移时的 answers / questions 表重新评分，
+    之后修改过标准答案或分值的试卷，回填的得分可能与当时保存的总分不一致，
+    这些行的 backfilled 为 1，统计时可以排除。
+    评分规则固定在本迁移中（_backfill_record / _backfill_result），不随 grading.py 变化；
+    无法解析的答案和题号不是整数的作答跳过并记录日志，不会使迁移失败。
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS record_answers (
+        source TEXT NOT NULL,                 -- 来源表：exam_records 或 exam_results
+        record_id INTEGER NOT NULL,           -- 考试记录ID
+        exam_id INTEGER NOT NULL,             -- 关联的试卷ID
+        question_id INTEGER,                  -- 题目ID，按题号作答的 exam_records 为 NULL
+        question_number INTEGER NOT NULL,     -- 题目序号
+        answer TEXT,                          -- 考生答案
+        is_correct INTEGER,                   -- 1 正确，0 错误，NULL 未评分
+        score INTEGER,                        -- 得分，未评分为 NULL
+        backfilled INTEGER NOT NULL DEFAULT 0 -- 1 表示迁移时按当时的标准答案回填
+    )
+    ''')
+    # 按题统计只读索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_record_answers_question "
+                   "ON record_answers (exam_id, question_number, backfilled, is_correct, score)")
+
+    insert = '''
+        INSERT INTO record_answers (
+            source, record_id, exam_id, question_id, question_number, answer, is_correct, score, backfilled
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+    '''
+    answer_keys = {}
+    for record_id, exam_id, answers in cursor.execute(
+            "SELECT id, exam_id, answers FROM exam_records WHERE answers IS NOT NULL").fetchall():
+        if exam_id not in answer_keys:
+            answer_keys[exam_id] = {
+                number: (answer, score) for number, answer, score in cursor.execute(
+                    "SELECT question_number, correct_answer, score FROM answers WHERE exam_id = ?", (exam_id,))
+            }
+        rows = _backfill_record(_load_answers(answers, 'exam_records', record_id), answer_keys[exam_id],
+                                record_id)
+        cursor.executemany(insert, [('exam_records', record_id, exam_id) + row for row in rows])
+
+    questions = {}
+    for result_id, exam_id, answers in cursor.execute(
+            "SELECT id, exam_id, answers FROM exam_results WHERE answers IS NOT NULL").fetchall():
+        if exam_id not in questions:
+            questions[exam_id] = {
+                row[0]: row[1:] for row in cursor.execute("""
+                    SELECT id, question_type, correct_answer, question_number, score
+                    FROM questions
+                    WHERE exam_id = ?
+                """, (exam_id,))
+            }
+        rows = _backfill_result(_load_answers(answers, 'exam_results', result_id), questions[exam_id],
+                                result_id)
+        cursor.executemany(insert, [('exam_results', result_id, exam_id) + row for row in rows])
+
+
+def _backfill_record(answers: Dict, answer_key: Dict[int, Tuple[str, int]], record_id: int) -> List[Tuple]:
+    """exam_records 的一条记录：答案以题号为键，与标准答案比较，不区分大小写"""
+    rows = []
+    for key, answer in answers.items():
+        number = _int_key(key, 'exam_records', record_id)
+        if number is None:
+            continue
+        answer = _answer_text(answer)
+        if number in answer_key:
+            correct_answer, score = answer_key[number]
+            correct = str(answer).upper() == str(correct_answer).upper()
+            rows.append((None, number, answer, int(correct), score if correct else 0))
+        else:
+            rows.append((None, number, answer, None, None))
+    return rows
+
+
+def _backfill_result(answers: Dict, questions: Dict[int, Tuple], result_id: int) -> List[Tuple]:
+    """exam_results 的一条记录：答案以题目ID为键，选择题和判断题不区分大小写比较，其余题型不评分"""
+    rows = []
+    for key, answer in answers.items():
+        question_id = _int_key(key, 'exam_results', result_id)
+        if question_id is None or question_id not in questions:
+            continue
+        q_type, correct_answer, number, score = questions[question_id]
+        answer = _answer_text(answer)
+        if q_type in ('single_choice', 'true_false'):
+            correct = str(answer).lower() == str(correct_answer).lower()
+            rows.append((question_id, number, answer, int(correct), score if correct else 0))
+        else:
+            rows.append((question_id, number, answer, None, None))
+    return rows
+
+
+def _int_key(key, source: str, record_id: int) -> Optional[int]:
+    """答案JSON的键转为整数，不是整数时记录日志并返回 None"""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        logger.warning("%s %s: 跳过无法识别的题号 %r", source, record_id, key)
+        return None
+
+
+def _answer_text(answer):
+    """答案按文本保存，JSON中的列表等结构转回JSON文本"""
+    if answer is None or isinstance(answer, (str, int, float)):
+        return answer
+    return json.dumps(answer, ensure_ascii=False)
+
+
+def _index_record_answers_by_question_id(cursor):
+    """按题统计同时按题目ID分组，索引加入 question_id 后仍只读索引"""
+    cursor.execute("DROP INDEX IF EXISTS idx_record_answers_question")
+    cursor.execute("CREATE INDEX idx_record_answers_question "
+                   "ON record_answers (exam_id, question_number, question_id, backfilled, is_correct, score)")
+
+
+# (版本号, 说明, 迁移函数)，版本号从1开始连续递增
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "基础表", _create_base_tables),
+    (2, "试卷状态和题型统计列", _add_exam_status_columns),
+    (3, "考试结果表", _create_exam_results),
+    (4, "常用查询的索引", _create_indexes),
+    (5, "逐题作答表", _create_record_answers),
+    (6, "逐题统计索引加入题目ID", _index_record_answers_by_question_id),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """数据库当前的结构版本，新建或旧版的数据库为 0"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """执行尚未应用的迁移，返回迁移后的版本号
+
+    每个迁移在独立的写事务中执行，执行前在事务内重新读取版本号，
+    多个程序同时打开数据库时只有一个会执行。
+    """
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return schema_version(conn)
+
+    cursor = conn.cursor()
+    for version, _, apply in MIGRATIONS:
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:
+                apply(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+
+def _load_answers(answers: str, source: str, record_id: int) -> dict:
+    """解析JSON格式的答案，损坏的记录记录日志并按未作答处理"""
+    try:
+        answers = json.loads(answers)
+    except ValueError:
+        answers = None
+    if not isinstance(answers, dict):
+        logger.warning("%s %s: 答案不是有效的JSON对象，跳过", source, record_id)
+        return {}
+    return answers
+
+
+def _add_column(cursor, table: str, column: str, declaration: str):
+    """添加列，已存在时跳过"""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
@@ -0,0 +1,171 @@
+"""导入时预先渲染的多级页面图片
+
+试卷导入后按一组固定的缩放级别渲染每一页，保存在
+exam_data/pyramids/<PDF内容SHA-256>/ 下，考试窗口直接读取这些图片，
+只有不在这组缩放级别中的显示才需要现场渲染。
+低于 TILE_ZOOM 的级别保存整页，其余级别按图块保存，与考试窗口的显示方式一致。
+"""
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from file_cache import file_sha256, split_page_ranges, write_atomic
+from page_renderer import FITZ_LOCK, PREVIEW_ZOOM, TILE_SIZE, TILE_ZOOM, PageRenderer, tiles_in_region
+from render_cache import zoom_key
+
+PYRAMID_DIR = Path('exam_data/pyramids')
+
+# 预先渲染的缩放级别：预览，以及默认缩放 1.5 前后各放大、缩小两次
+PYRAMID_ZOOMS = (PREVIEW_ZOOM,) + tuple(zoom_key(1.5 * 1.2 ** step) for step in range(-2, 3))
+
+MANIFEST = 'manifest.json'
+
+
+class PagePyramid:
+    """一份试卷已渲染好的多级页面图片"""
+
+    def __init__(self, directory: Path, zooms: Iterable[float]):
+        self.directory = Path(directory)
+        self.zooms = set(zooms)
+
+    @classmethod
+    def load(cls, pdf_hash: str, root: Path = PYRAMID_DIR) -> Optional['PagePyramid']:
+        """读取已完成的图片集，不存在、未完成或图块大小不同时返回 None"""
+        directory = Path(root) / pdf_hash
+        try:
+            with open(directory / MANIFEST, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('tile_size') != TILE_SIZE or manifest.get('tile_zoom') != TILE_ZOOM:
+            return None
+        return cls(directory, manifest['zooms'])
+
+    def get(self, page_number: int, zoom_level: float,
+            tile: Optional[Tuple[int, int]] = None) -> Optional[bytes]:
+        """读取预先渲染的 PNG，该缩放级别未预先渲染或文件缺失时返回 None"""
+        zoom = zoom_key(zoom_level)
+        if zoom not in self.zooms:
+            return None
+        try:
+            return image_path(self.directory, page_number, zoom, tile).read_bytes()
+        except OSError:
+            return None
+
+    def get_region(self, page_number: int, zoom_level: float, region: Tuple[int, int, int, int],
+                   page_size: Tuple[int, int]) -> Optional[bytes]:
+        """从整页图片或相交的图块中拼出整页像素坐标中的 region，返回 PPM 数据
+
+        用于按题显示的裁剪区域；page_size 为该缩放下整页的像素尺寸。
+        该缩放级别未预先渲染或有图片缺失时返回 None。
+        """
+        if zoom_key(zoom_level) not in self.zooms:
+            return None
+        region = fitz.IRect(region) & fitz.IRect(0, 0, *page_size)
+        if region.is_empty:
+            return None
+        if zoom_key(zoom_level) >= TILE_ZOOM:
+            sources = [((col, row), (col * TILE_SIZE, row * TILE_SIZE))
+                       for col, row in tiles_in_region(page_size, *region)]
+        else:
+            sources = [(None, (0, 0))]
+
+        with FITZ_LOCK:
+            target = fitz.Pixmap(fitz.csRGB, region, False)
+            for tile, origin in sources:
+                data = self.get(page_number, zoom_level, tile)
+                if data is None:
+                    return None
+                pix = fitz.Pixmap(data)
+                pix.set_origin(*origin)
+                target.copy(pix, fitz.IRect(pix.irect) & region)
+            return target.tobytes("ppm")
+
+
+def image_path(directory: Path, page_number: int, zoom: float, tile: Optional[Tuple[int, int]] = None) -> Path:
+    """图片文件路径：z<缩放>/p<页码>.png 或 z<缩放>/p<页码>-t<列>_<行>.png"""
+    name = f"p{page_number}" if tile is None else f"p{page_number}-t{tile[0]}_{tile[1]}"
+    return Path(directory) / f"z{zoom:.3f}" / f"{name}.png"
+
+
+def build_pyramid(pdf_path: str, workers: Optional[int] = None, zooms: Iterable[float] = PYRAMID_ZOOMS,
+                  root: Path = PYRAMID_DIR) -> Path:
+    """渲染PDF的所有页面，按页范围分配到进程池，返回图片目录
+
+    图片全部写完后才写入清单，中途失败的目录不会被考试窗口使用，
+    重新执行时跳过已存在的图片。相同内容的PDF只渲染一次。
+    workers 为 1 时在当前线程中渲染，PyMuPDF 调用都持有 FITZ_LOCK，
+    可以在考试窗口所在的进程中使用。
+    """
+    directory = Path(root) / file_sha256(pdf_path)
+    if (directory / MANIFEST).exists():
+        return directory
+
+    zooms = sorted(zoom_key(zoom) for zoom in zooms)
+    with FITZ_LOCK:
+        doc = fitz.open(pdf_path)
+        try:
+            page_count = len(doc)
+        finally:
+            doc.close()
+
+    workers = workers or os.cpu_count() or 1
+    ranges = split_page_ranges(page_count, workers)
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            list(executor.map(_render_page_range,
+                              [str(pdf_path)] * len(ranges),
+                              [str(directory)] * len(ranges),
+                              [start for start, _ in ranges],
+                              [stop for _, stop in ranges],
+                              [zooms] * len(ranges)))
+    else:
+        for start, stop in ranges:
+            _render_page_range(str(pdf_path), str(directory), start, stop, zooms)
+
+    write_atomic(directory / MANIFEST, json.dumps({
+        'pages': page_count,
+        'zooms': zooms,
+        'tile_size': TILE_SIZE,
+        'tile_zoom': TILE_ZOOM
+    }).encode('utf-8'))
+    return directory
+
+
+def remove_pyramid(pdf_hash: str, root: Path = PYRAMID_DIR):
+    """删除某个PDF的预先渲染图片"""
+    shutil.rmtree(Path(root) / pdf_hash, ignore_errors=True)
+
+
+def _render_page_range(pdf_path: str, directory: str, start: int, stop: int, zooms: Iterable[float]) -> int:
+    """渲染 [start, stop) 页的所有级别，返回新写入的图片数（进程池的子进程入口，workers 为 1 时直接调用）"""
+    written = 0
+    with FITZ_LOCK:
+        doc = fitz.open(pdf_path)
+    try:
+        # 每页解析一次，各级别都从同一个显示列表渲染
+        renderer = PageRenderer(doc, max_display_lists=1)
+        for page_number in range(start, stop):
+            for zoom in zooms:
+                if zoom >= TILE_ZOOM:
+                    size = renderer.page_pixel_size(page_number, zoom)
+                    tiles = tiles_in_region(size, 0, 0, *size)
+                else:
+                    tiles = [None]
+                for tile in tiles:
+                    path = image_path(directory, page_number, zoom, tile)
+                    if path.exists():
+                        continue
+                    with FITZ_LOCK:
+                        png = renderer.render_pixmap(page_number, zoom, tile).tobytes("png")
+                    write_atomic(path, png)
+                    written += 1
+    finally:
+        with FITZ_LOCK:
+            doc.close()
+    return written
@@ -0,0 +1,284 @@
+import math
+import queue
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from file_cache import RenderDiskCache
+
+# PyMuPDF 不是线程安全的，所有线程访问文档时都需持有此锁
+FITZ_LOCK = threading.RLock()
+
+# 缩放达到此值时按图块只渲染可见区域
+TILE_ZOOM = 1.5
+# 图块边长（像素）
+TILE_SIZE = 512
+# 默认最多保留的页面显示列表数
+DEFAULT_DISPLAY_LISTS = 32
+# 清晰渲染完成前先显示的低分辨率预览的缩放级别
+PREVIEW_ZOOM = 0.4
+
+
+def page_scale(zoom_level: float) -> float:
+    """缩放级别对应的渲染倍数"""
+    return 2 * zoom_level
+
+
+def tiles_in_region(size: Tuple[int, int], x0: float, y0: float, x1: float, y1: float) -> List[Tuple[int, int]]:
+    """与区域相交的图块 (列, 行)，按行优先排列，区域超出页面的部分忽略"""
+    width, height = size
+    cols = range(max(0, int(x0 // TILE_SIZE)), min(math.ceil(width / TILE_SIZE), math.ceil(x1 / TILE_SIZE)))
+    rows = range(max(0, int(y0 // TILE_SIZE)), min(math.ceil(height / TILE_SIZE), math.ceil(y1 / TILE_SIZE)))
+    return [(col, row) for row in rows for col in cols]
+
+
+def question_regions(questions: Iterable[Tuple[int, int, Tuple[float, float, float, float]]],
+                     page_rects: List[fitz.Rect], margin: float = 4) -> List[Tuple[int, int, Tuple]]:
+    """按题目起始位置划分页面，返回按题号排列的 (题号, 页索引, 裁剪区域)
+
+    questions 为 (题号, 页码(从1开始), 题目首行bbox)。每题从题目顶部到同页下一题顶部，
+    同页最后一题到页面底部，宽度取整页；页码或bbox无效的题目忽略。
+    """
+    starts = sorted(
+        (page_number - 1, bbox[1], question_number)
+        for question_number, page_number, bbox in questions
+        if page_number and bbox and 0 < page_number <= len(page_rects)
+    )
+    regions = []
+    for i, (page_index, top, question_number) in enumerate(starts):
+        rect = page_rects[page_index]
+        if i + 1 < len(starts) and starts[i + 1][0] == page_index:
+            bottom = starts[i + 1][1] - margin
+        else:
+            bottom = rect.y1
+        top = max(rect.y0, top - margin)
+        regions.append((question_number, page_index, (rect.x0, top, rect.x1, max(bottom, top + 1))))
+    regions.sort(key=lambda region: region[0])
+    return regions
+
+
+class PageRenderer:
+    """渲染一个文档的页面，可在任意线程调用
+
+    每页第一次渲染时解析内容流并记录为 fitz.DisplayList，
+    之后任意缩放和裁剪区域的渲染都从中回放，不再重新解析。
+    最多保留 max_display_lists 页，超出时淘汰最久未用的页。
+    给出 disk_cache 和 PDF 内容哈希时，渲染结果同时以 PNG 保存到磁盘，
+    之后（包括其他考试机和之后的考试）直接读取。
+    给出导入时预先渲染的 pyramid（page_pyramid.PagePyramid）时优先读取其中的图片。
+    """
+
+    def __init__(self, doc: fitz.Document, max_display_lists: int = DEFAULT_DISPLAY_LISTS,
+                 disk_cache: Optional[RenderDiskCache] = None, pdf_hash: Optional[str] = None,
+                 pyramid=None):
+        self.doc = doc
+        self.max_display_lists = max_display_lists
+        self._display_lists = OrderedDict()
+        self.disk_cache = disk_cache if pdf_hash else None
+        self.pdf_hash = pdf_hash
+        self.pyramid = pyramid
+
+    def display_list(self, page_number: int) -> fitz.DisplayList:
+        """页面的显示列表，调用方需持有 FITZ_LOCK"""
+        display_list = self._display_lists.get(page_number)
+        if display_list is None:
+            display_list = self.doc[page_number].get_displaylist()
+            self._display_lists[page_number] = display_list
+            while len(self._display_lists) > self.max_display_lists:
+                self._display_lists.popitem(last=False)
+        else:
+            self._display_lists.move_to_end(page_number)
+        return display_list
+
+    def page_rect(self, page_number: int) -> fitz.Rect:
+        """页面区域（页面坐标）"""
+        # 只需页面尺寸，不为此解析内容流
+        with FITZ_LOCK:
+            display_list = self._display_lists.get(page_number)
+            return display_list.rect if display_list is not None else self.doc[page_number].rect
+
+    def page_pixel_size(self, page_number: int, zoom_level: float,
+                        clip: Optional[Tuple] = None) -> Tuple[int, int]:
+        """页面或其中裁剪区域按指定缩放渲染后的像素尺寸"""
+        rect = self.page_rect(page_number)
+        if clip is not None:
+            rect = fitz.Rect(clip) & rect
+        scale = page_scale(zoom_level)
+        return math.ceil(rect.width * scale), math.ceil(rect.height * scale)
+
+    def pixel_offset(self, page_number: int, zoom_level: float, clip: Optional[Tuple] = None) -> Tuple[int, int]:
+        """裁剪区域左上角在整页渲染结果中的像素位置"""
+        if clip is None:
+            return 0, 0
+        rect = self.page_rect(page_number)
+        scale = page_scale(zoom_level)
+        return int(max(0, clip[0] - rect.x0) * scale), int(max(0, clip[1] - rect.y0) * scale)
+
+    def clip_pixel_region(self, page_number: int, zoom_level: float,
+                          tile: Optional[Tuple[int, int]], clip: Tuple) -> Tuple[int, int, int, int]:
+        """裁剪区域（或其中一个图块）在整页渲染结果中的像素区域，与 render_pixmap 的结果大小一致"""
+        page = self.page_rect(page_number)
+        matrix = fitz.Matrix(page_scale(zoom_level), page_scale(zoom_level))
+        rect = self._render_rect(page, zoom_level, tile, clip)
+        origin = (page * matrix).irect
+        region = (rect * matrix).irect
+        return (region.x0 - origin.x0, region.y0 - origin.y0, region.x1 - origin.x0, region.y1 - origin.y0)
+
+    def render(self, page_number: int, zoom_level: float,
+               tile: Optional[Tuple[int, int]] = None, clip: Optional[Tuple] = None) -> bytes:
+        """将页面或裁剪区域（或其中一个图块）渲染为 PPM 或 PNG 数据，可直接交给 tk.PhotoImage
+
+        预先渲染或磁盘缓存命中时返回其中的 PNG，否则渲染后返回 PPM 并把 PNG 写入磁盘缓存。
+        裁剪区域从预先渲染的整页图片或图块中裁出（PPM）。
+        """
+        if self.pyramid:
+            if clip is None:
+                data = self.pyramid.get(page_number, zoom_level, tile)
+            else:
+                data = self.pyramid.get_region(page_number, zoom_level,
+                                               self.clip_pixel_region(page_number, zoom_level, tile, clip),
+                                               self.page_pixel_size(page_number, zoom_level))
+            if data is not None:
+                return data
+
+        key = None
+        if self.disk_cache:
+            key = self.disk_cache.key_for(self.pdf_hash, page_number, zoom_level,
+                                          None if tile is None else (TILE_SIZE,) + tuple(tile), clip)
+            data = self.disk_cache.get(key)
+            if data is not None:
+                return data
+
+        with FITZ_LOCK:
+            pix = self.render_pixmap(page_number, zoom_level, tile, clip)
+            data = pix.tobytes("ppm")
+            png = pix.tobytes("png") if key else None
+        if key:
+            try:
+                self.disk_cache.put(key, png)
+            except OSError:
+                # 缓存目录不可写时只影响之后的速度
+                pass
+        return data
+
+    def render_pixmap(self, page_number: int, zoom_level: float,
+                      tile: Optional[Tuple[int, int]] = None, clip: Optional[Tuple] = None) -> fitz.Pixmap:
+        """将页面或裁剪区域（或其中一个图块）渲染为不带透明通道的 RGB 像素图
+
+        clip 为页面坐标中的区域，只计算该区域内的像素；图块按裁剪区域的左上角划分。
+        """
+        scale = page_scale(zoom_level)
+        with FITZ_LOCK:
+            display_list = self.display_list(page_number)
+            if clip is not None or tile is not None:
+                clip = self._render_rect(display_list.rect, zoom_level, tile, clip)
+            return display_list.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip)
+
+    @staticmethod
+    def _render_rect(page: fitz.Rect, zoom_level: float, tile: Optional[Tuple[int, int]],
+                     clip: Optional[Tuple]) -> fitz.Rect:
+        """要渲染的页面坐标区域：裁剪区域，或其中（无裁剪时为整页中）的一个图块"""
+        rect = page if clip is None else fitz.Rect(clip) & page
+        if tile is None:
+            return rect
+        # 图块的像素区域换算为页面坐标，只渲染这一部分
+        scale = page_scale(zoom_level)
+        col, row = tile
+        return fitz.Rect(
+            rect.x0 + col * TILE_SIZE / scale,
+            rect.y0 + row * TILE_SIZE / scale,
+            rect.x0 + (col + 1) * TILE_SIZE / scale,
+            rect.y0 + (row + 1) * TILE_SIZE / scale
+        ) & rect
+
+    def preview_pixmap(self, page_number: int, zoom_level: float = PREVIEW_ZOOM) -> fitz.Pixmap:
+        """整页像素图，用于拉伸显示预览，有预先渲染的图片时直接解码而不渲染"""
+        data = self.pyramid.get(page_number, zoom_level) if self.pyramid else None
+        with FITZ_LOCK:
+            if data is not None:
+                return fitz.Pixmap(data)
+            return self.render_pixmap(page_number, zoom_level)
+
+    @staticmethod
+    def scale_region(pix: fitz.Pixmap, size: Tuple[int, int], region: Tuple[int, int, int, int]) -> bytes:
+        """把像素图拉伸到 size 后取 region 部分，返回 PPM 数据，只计算 region 内的像素"""
+        with FITZ_LOCK:
+            return fitz.Pixmap(pix, size[0], size[1], fitz.IRect(region)).tobytes("ppm")
+
+    def clear(self):
+        """释放所有显示列表"""
+        with FITZ_LOCK:
+            self._display_lists.clear()
+
+
+def neighbour_pages(current: int, page_count: int, radius: int) -> List[int]:
+    """当前页前后 radius 页，按距离由近到远、同距离先后页的顺序排列"""
+    pages = []
+    for distance in range(1, radius + 1):
+        for page_number in (current + distance, current - distance):
+            if 0 <= page_number < page_count:
+                pages.append(page_number)
+    return pages
+
+
+class RenderWorker:
+    """在后台线程中渲染页面，用于预取相邻页面和清晰渲染当前页
+
+    每项任务是传给 render 的参数元组，如 (页码, 缩放, 图块)。
+    render 在后台线程中执行，只能做与 Tk 无关的工作；结果放入队列，
+    由 Tk 线程调用 poll() 取回后再转换为可显示的图片。
+    每次 schedule() 都会使之前尚未完成的任务作废。
+    """
+
+    def __init__(self, render: Callable, name: str = 'page-render'):
+        self.render = render
+        # 请求的代数，变化后旧请求的剩余任务不再执行，已完成的结果被丢弃
+        self.generation = 0
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, jobs: Iterable[Tuple]):
+        """按顺序执行任务，取消之前的请求"""
+        self.generation += 1
+        self._requests.put((self.generation, list(jobs)))
+
+    def cancel(self):
+        """取消所有未完成的任务"""
+        self.generation += 1
+
+    def poll(self) -> List[Tuple[Tuple, object]]:
+        """在 Tk 线程中取回已完成且未过期的 (任务, 渲染结果)，渲染失败的结果为 None"""
+        results = []
+        while True:
+            try:
+                generation, job, result = self._results.get_nowait()
+            except queue.Empty:
+                return results
+            if generation == self.generation:
+                results.append((job, result))
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程，等待正在进行的渲染结束"""
+        self.cancel()
+        self._requests.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            generation, jobs = request
+            for job in jobs:
+                if generation != self.generation:
+                    break
+                try:
+                    result = self.render(*job)
+                except Exception:
+                    # 后台渲染失败不影响显示，需要时会在前台重新渲染
+                    result = None
+                self._results.put((generation, job, result))
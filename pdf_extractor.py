@@ -1,13 +1,24 @@
 import fitz  # PyMuPDF
+import hashlib
 import json
 from pathlib import Path
 import re
 import shutil
-from typing import List, Dict, Tuple
-import uuid
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
+from concurrent.futures import ProcessPoolExecutor
+from file_cache import ExtractionCache, split_page_ranges, write_atomic
+from instrumentation import Metrics, get_logger
+
+logger = get_logger('extractor')
 
 class PDFExtractor:
-    def __init__(self):
+    # 提取逻辑或输出格式变化时递增，使旧的缓存结果失效
+    VERSION = 4
+    
+    def __init__(self, workers: int = 1, use_cache: bool = True):
+        # 并行提取使用的进程数，1 表示串行
+        self.workers = workers
+        
         self.base_dir = Path('exam_data')
         self.images_dir = self.base_dir / 'images'
         self.temp_dir = self.base_dir / 'temp'
@@ -16,74 +27,321 @@ class PDFExtractor:
         self.images_dir.mkdir(parents=True, exist_ok=True)
         self.temp_dir.mkdir(parents=True, exist_ok=True)
         
+        # 当前文档中已保存图片的 xref -> 路径
+        self._saved_images = {}
+        
+        # 按PDF内容哈希缓存提取结果
+        self.cache = ExtractionCache(self.base_dir / 'cache' / 'extraction') if use_cache else None
+        
+        # 各阶段耗时和计数，多次提取累计，并行提取时包含子进程的记录
+        self.metrics = Metrics()
+        
         # 题目标记模式
         self.patterns = {
             'question_start': r'^\s*\d+[\.)、]\s+|^\s*[一二三四五六七八九十]+、\s*|[（(]\s*\d+\s*[)）]',
             'section_start': r'[一二三四五六七八九十]+、|^\d+、|[（(]\s*\d+\s*[)）]'
         }
     
-    def extract_questions(self, pdf_path: str) -> List[Dict]:
-        """从PDF中提取题目"""
-        questions = []
-        doc = fitz.open(pdf_path)
+    def extract_questions(self, pdf_path: str, workers: Optional[int] = None) -> List[Dict]:
+        """从PDF中提取题目
+
+        workers 大于1时按页范围拆分到进程池并行扫描，结果按页序合并，
+        与串行提取的返回值一致。未指定时使用构造时的 workers。
+        同一PDF（按内容哈希）再次提取时直接返回缓存结果。
+        """
+        workers = self.workers if workers is None else workers
+        if workers <= 1:
+            return list(self.iter_questions(pdf_path))
+        
+        cache_key, cached = self._get_cached(pdf_path)
+        if cached is not None:
+            return cached
+        
+        with self.metrics.span('read'):
+            doc = fitz.open(pdf_path)
+        try:
+            page_count = len(doc)
+        finally:
+            doc.close()
+        
+        if page_count > 1:
+            page_events = self._scan_pages_parallel(pdf_path, page_count, workers)
+        else:
+            page_events = self._scan_page_range(pdf_path, 0, page_count)
+        
+        questions = self._process_questions(self._iter_assembled(page_events))
+        self.metrics.incr('questions', len(questions))
+        logger.info("%s: %d页, %d个进程, %d道题目", pdf_path, page_count, workers, len(questions))
+        
+        if cache_key:
+            self.cache.put_questions(cache_key, questions)
+        return questions
+    
+    def iter_questions(self, pdf_path: str) -> Iterator[Dict]:
+        """逐题产出提取结果
+
+        每道题在下一道题开始（或文档结束）时即产出，同一时间只保留一页的版面结构。
+        题目产出的同时逐题写入缓存的临时文件，完整遍历后才提交，中途停止则不缓存。
+        命中缓存时一次读入缓存的题目列表（只有题目，不含版面结构）。
+        """
+        cache_key, cached = self._get_cached(pdf_path)
+        if cached is not None:
+            yield from cached
+            return
+        
+        writer = self.cache.question_writer(cache_key) if cache_key else None
+        with self.metrics.span('read'):
+            doc = fitz.open(pdf_path)
+        # xref 只在同一文档内有效，每次打开文档时重置
+        self._saved_images = {}
+        try:
+            page_events = (self._scan_page(doc[page_num], page_num) for page_num in range(len(doc)))
+            assembled = self.metrics.time_iter('classify', self._iter_assembled(page_events))
+            for number, question in enumerate(assembled, 1):
+                question = self._process_question(number, question)
+                self.metrics.incr('questions')
+                if writer:
+                    writer.add(question)
+                yield question
+            if writer:
+                writer.commit()
+        finally:
+            doc.close()
+            if writer:
+                writer.close()
+    
+    def extract_pages(self, pdf_path: str, known: Optional[Dict[int, Dict]] = None) -> Dict:
+        """按页指纹增量提取
+
+        known 为上次提取保存的 {页码: {'fingerprint': 指纹, 'events': 事件列表}}，
+        指纹未变的页直接复用保存的事件，只重新扫描变化的页。
+        返回完整的题目列表、每页的指纹和事件，以及发生变化的页码。
+        """
+        known = known or {}
+        
+        cache_key, pages = self._get_cached(pdf_path, 'pdf_extractor_pages')
+        if pages is None:
+            pages = []
+            with self.metrics.span('read'):
+                doc = fitz.open(pdf_path)
+            # xref 只在同一文档内有效，每次打开文档时重置
+            self._saved_images = {}
+            # 各页共用的字体、表单等对象只计算一次哈希
+            xref_digests = {}
+            try:
+                for page_num in range(len(doc)):
+                    page = doc[page_num]
+                    with self.metrics.span('fingerprint'):
+                        fingerprint = self._page_fingerprint(doc, page, xref_digests)
+                    record = known.get(page_num + 1)
+                    if record and record['fingerprint'] == fingerprint:
+                        events = record['events']
+                        self.metrics.incr('pages_reused')
+                    else:
+                        events = self._scan_page(page, page_num)
+                    pages.append({
+                        'page_number': page_num + 1,
+                        'fingerprint': fingerprint,
+                        'events': events
+                    })
+            finally:
+                doc.close()
+            
+            if cache_key:
+                self.cache.put_questions(cache_key, pages)
+        
+        changed = [
+            page['page_number'] for page in pages
+            if known.get(page['page_number'], {}).get('fingerprint') != page['fingerprint']
+        ]
+        with self.metrics.span('classify'):
+            questions = self._process_questions(self._iter_assembled(page['events'] for page in pages))
+        self.metrics.incr('questions', len(questions))
+        logger.info("%s: %d页, 变化%d页, %d道题目", pdf_path, len(pages), len(changed), len(questions))
+        return {'questions': questions, 'pages': pages, 'changed': changed}
+    
+    def _page_fingerprint(self, doc: fitz.Document, page: fitz.Page,
+                          xref_digests: Optional[Dict[int, bytes]] = None) -> str:
+        """页面指纹：内容流、资源字典及其引用的对象、图片数据和页面尺寸的哈希
+
+        资源字典只包含对象引用，修改表单XObject或字体的数据流不会改变字典本身，
+        因此逐层跟随引用，把引用到的每个对象的定义和数据流都计入指纹。
+        xref_digests 缓存同一文档中各对象的哈希。
+        """
+        if xref_digests is None:
+            xref_digests = {}
+        digest = hashlib.sha256()
+        for xref in page.get_contents():
+            digest.update(doc.xref_stream_raw(xref) or b'')
         
+        resources = self._page_resources(doc, page.xref)
+        digest.update(resources.encode('utf-8'))
+        
+        for xref in self._referenced_xrefs(doc, resources):
+            if xref not in xref_digests:
+                object_digest = hashlib.sha256(doc.xref_object(xref, compressed=True).encode('utf-8'))
+                if doc.xref_is_stream(xref):
+                    object_digest.update(doc.xref_stream_raw(xref) or b'')
+                xref_digests[xref] = object_digest.digest()
+            digest.update(xref_digests[xref])
+        
+        for img in page.get_images(full=True):
+            digest.update(doc.xref_stream_raw(img[0]) or b'')
+        
+        digest.update(f"{tuple(page.rect)}/{page.rotation}".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _page_resources(self, doc: fitz.Document, xref: int) -> str:
+        """页面的资源字典定义，页面本身没有时沿 /Parent 向上取继承的资源字典，都没有时为空字符串"""
+        seen = set()
+        while xref and xref not in seen:
+            seen.add(xref)
+            kind, resources = doc.xref_get_key(xref, 'Resources')
+            if kind == 'xref':
+                return doc.xref_object(int(resources.split()[0]), compressed=True)
+            if kind == 'dict':
+                return resources
+            kind, parent = doc.xref_get_key(xref, 'Parent')
+            xref = int(parent.split()[0]) if kind == 'xref' else 0
+        return ''
+    
+    def _referenced_xrefs(self, doc: fitz.Document, source: str) -> List[int]:
+        """返回对象定义中直接或间接引用的所有对象（顺序固定），不跟随到页面树"""
+        xrefs = []
+        seen = set()
+        pending = [source]
+        while pending:
+            for match in re.finditer(r'(\d+) \d+ R\b', pending.pop()):
+                xref = int(match.group(1))
+                if xref in seen or not 0 < xref < doc.xref_length():
+                    continue
+                seen.add(xref)
+                if doc.xref_get_key(xref, 'Type')[1] in ('/Page', '/Pages'):
+                    continue
+                xrefs.append(xref)
+                pending.append(doc.xref_object(xref, compressed=True))
+        return xrefs
+    
+    def _get_cached(self, pdf_path: str, name: str = 'pdf_extractor') -> Tuple[Optional[str], Optional[List[Dict]]]:
+        """返回缓存键和缓存的结果列表，未启用缓存或未命中时结果为 None"""
+        if not self.cache:
+            return None, None
+        cache_key = self.cache.key_for(pdf_path, name, self.VERSION)
+        cached = self.cache.get_questions(cache_key)
+        if cached is not None:
+            logger.debug("%s: 命中缓存", pdf_path)
+        self.metrics.incr('cache_hits' if cached is not None else 'cache_misses')
+        return cache_key, cached
+    
+    def _scan_pages_parallel(self, pdf_path: str, page_count: int, workers: int) -> List[List[Tuple]]:
+        """将页范围分配给多个子进程扫描，按页序返回各页事件"""
+        ranges = split_page_ranges(page_count, workers)
+        page_events = []
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            # map 按提交顺序返回结果，保证页序
+            for chunk, metrics in executor.map(_scan_page_range,
+                                               [pdf_path] * len(ranges),
+                                               [start for start, _ in ranges],
+                                               [stop for _, stop in ranges]):
+                page_events.extend(chunk)
+                self.metrics.merge(metrics)
+        return page_events
+    
+    def _scan_page_range(self, pdf_path: str, start: int, stop: int) -> List[List[Tuple]]:
+        """打开文档并扫描 [start, stop) 页，返回各页事件"""
+        with self.metrics.span('read'):
+            doc = fitz.open(pdf_path)
+        # xref 只在同一文档内有效，每次打开文档时重置
+        self._saved_images = {}
         try:
-            current_section = None
-            current_question = None
+            return [self._scan_page(doc[page_num], page_num) for page_num in range(start, stop)]
+        finally:
+            doc.close()
+    
+    def _scan_page(self, page: fitz.Page, page_num: int) -> List[Tuple]:
+        """扫描单页，返回与跨页状态无关的事件列表
+
+        事件形式：
+        ('section', 题型) / ('question', 文本, 页码, bbox, 图片列表) / ('text', 文本)
+        """
+        with self.metrics.span('classify'):
+            return self._scan_blocks(page, page_num)
+    
+    def _scan_blocks(self, page: fitz.Page, page_num: int) -> List[Tuple]:
+        """逐个文本块分类，版面提取和图片保存分别计时"""
+        self.metrics.incr('pages')
+        events = []
+        with self.metrics.span('extract'):
+            blocks = page.get_text("dict")["blocks"]
+        # 本页图片索引，首次有题目需要时才建立
+        image_index = None
+        
+        for block in blocks:
+            if "lines" not in block:
+                continue
+                
+            text = self._get_block_text(block)
+            if not text.strip():
+                continue
+            
+            # 检查是否是新的题型部分
+            if self._is_section_start(text):
+                events.append(('section', self._get_section_type(text)))
             
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                blocks = page.get_text("dict")["blocks"]
+            # 检查是否是新题目
+            elif self._is_question_start(text):
+                # 检查题目区域是否包含图片
+                with self.metrics.span('image'):
+                    if image_index is None:
+                        image_index = self._build_image_index(page)
+                    images = self._find_images(page.parent, image_index, fitz.Rect(block['bbox']))
+                events.append(('question', text, page_num + 1, list(block['bbox']), images))
+            
+            else:
+                events.append(('text', text))
+        
+        return events
+    
+    def _iter_assembled(self, page_events: Iterable[List[Tuple]]) -> Iterator[Dict]:
+        """按页序合并事件，延续跨页的题型和题目状态，题目结束时产出"""
+        current_section = None
+        current_question = None
+        
+        for events in page_events:
+            for event in events:
+                kind = event[0]
                 
-                for block in blocks:
-                    if "lines" not in block:
-                        continue
-                        
-                    text = self._get_block_text(block)
-                    if not text.strip():
-                        continue
-                    
-                    # 检查是否是新的题型部分
-                    if self._is_section_start(text):
-                        current_section = self._get_section_type(text)
-                        continue
+                if kind == 'section':
+                    current_section = event[1]
+                
+                elif kind == 'question':
+                    # 前一个题目已结束
+                    if current_question:
+                        yield current_question
                     
-                    # 检查是否是新题目
-                    if self._is_question_start(text):
-                        # 保存前一个题目
-                        if current_question:
-                            questions.append(current_question)
-                        
-                        # 创建新题目
-                        current_question = {
-                            'type': current_section or 'unknown',
-                            'text': text,
-                            'page_number': page_num + 1,
-                            'bbox': list(block['bbox']),
-                            'images': [],
-                            'options': []
-                        }
-                        
-                        # 检查题目区域是否包含图片
-                        rect = fitz.Rect(block['bbox'])
-                        self._extract_images(page, rect, current_question)
+                    # 创建新题目
+                    _, text, page_number, bbox, images = event
+                    current_question = {
+                        'type': current_section or 'unknown',
+                        'text': text,
+                        'page_number': page_number,
+                        'bbox': bbox,
+                        'images': images,
+                        'options': []
+                    }
+                
+                # 如果是当前题目的一部分
+                elif current_question:
+                    text = event[1]
+                    current_question['text'] += '\n' + text
                     
-                    # 如果是当前题目的一部分
-                    elif current_question:
-                        current_question['text'] += '\n' + text
-                        
-                        # 检查是否包含选项
-                        if re.match(r'^[A-D][.、]', text):
-                            current_question['options'].append(text)
-            
-            # 添加最后一个题目
-            if current_question:
-                questions.append(current_question)
-            
-        finally:
-            doc.close()
+                    # 检查是否包含选项
+                    if re.match(r'^[A-D][.、]', text):
+                        current_question['options'].append(text)
         
-        return self._process_questions(questions)
+        # 最后一个题目
+        if current_question:
+            yield current_question
     
     def _get_block_text(self, block: Dict) -> str:
         """获取文本块的内容"""
@@ -112,41 +370,60 @@ class PDFExtractor:
             return 'programming'
         return 'unknown'
     
-    def _extract_images(self, page: fitz.Page, rect: fitz.Rect, question: Dict):
-        """提取指定区域的图片"""
-        images = page.get_images(full=True)
+    def _build_image_index(self, page: fitz.Page) -> List[Tuple[int, fitz.Rect]]:
+        """建立本页图片的 (xref, 显示区域) 索引"""
+        return [(img[0], page.get_image_bbox(img)) for img in page.get_images(full=True)]
+    
+    def _find_images(self, doc: fitz.Document, image_index: List[Tuple[int, fitz.Rect]], rect: fitz.Rect) -> List[str]:
+        """返回与指定区域重叠的图片路径"""
+        image_paths = []
+        for xref, image_rect in image_index:
+            # 如果图片与题目区域有重叠
+            if rect.intersects(image_rect):
+                image_path = self._save_image(doc, xref)
+                if image_path:
+                    image_paths.append(image_path)
+        return image_paths
+    
+    def _save_image(self, doc: fitz.Document, xref: int) -> Optional[str]:
+        """按内容哈希保存图片，同一 xref 或相同内容只写入一次"""
+        if xref in self._saved_images:
+            self.metrics.incr('images_reused')
+            return self._saved_images[xref]
         
-        for img_index, img in enumerate(images):
-            xref = img[0]
-            base_image = page.parent.extract_image(xref)
-            
-            if base_image:
-                image_rect = page.get_image_bbox(img)
-                # 如果图片与题目区域有重叠
-                if rect.intersects(image_rect):
-                    # 保存图片
-                    image_path = self.images_dir / f"{uuid.uuid4()}.{base_image['ext']}"
-                    with open(image_path, 'wb') as f:
-                        f.write(base_image['image'])
-                    question['images'].append(str(image_path))
-    
-    def _process_questions(self, questions: List[Dict]) -> List[Dict]:
+        image_path = None
+        base_image = doc.extract_image(xref)
+        if base_image:
+            digest = hashlib.sha256(base_image['image']).hexdigest()
+            path = self.images_dir / f"{digest}.{base_image['ext']}"
+            if not path.exists():
+                # 并行进程可能同时写入同一图片
+                write_atomic(path, base_image['image'])
+                self.metrics.incr('images_saved')
+            else:
+                self.metrics.incr('images_reused')
+            image_path = str(path)
+        
+        self._saved_images[xref] = image_path
+        return image_path
+    
+    def _process_questions(self, questions: Iterable[Dict]) -> List[Dict]:
         """处理提取的题目，整理格式"""
-        processed = []
-        for i, q in enumerate(questions, 1):
-            question_data = {
-                'question_number': i,
-                'question_type': q['type'],
-                'question_text': q['text'],
-                'question_image_path': json.dumps(q['images']) if q['images'] else None,
-                'options': json.dumps(q['options']) if q['options'] else None,
-                'options_image_path': None,  # 暂时不处理选项图片
-                'score': self._get_default_score(q['type']),
-                'page_number': q['page_number'],
-                'bbox': json.dumps(q['bbox'])
-            }
-            processed.append(question_data)
-        return processed
+        return [self._process_question(i, q) for i, q in enumerate(questions, 1)]
+    
+    def _process_question(self, number: int, q: Dict) -> Dict:
+        """整理单个题目的格式"""
+        return {
+            'question_number': number,
+            'question_type': q['type'],
+            'question_text': q['text'],
+            'question_image_path': json.dumps(q['images']) if q['images'] else None,
+            'options': json.dumps(q['options']) if q['options'] else None,
+            'options_image_path': None,  # 暂时不处理选项图片
+            'score': self._get_default_score(q['type']),
+            'page_number': q['page_number'],
+            'bbox': json.dumps(q['bbox'])
+        }
     
     def _get_default_score(self, question_type: str) -> int:
         """获取题目类型的默认分值"""
@@ -163,3 +440,9 @@ class PDFExtractor:
         if self.temp_dir.exists():
             shutil.rmtree(self.temp_dir)
             self.temp_dir.mkdir()
+
+
+def _scan_page_range(pdf_path: str, start: int, stop: int) -> Tuple[List[List[Tuple]], Dict]:
+    """子进程入口：每个进程使用独立的提取器和文档句柄，连同计时和计数一起返回"""
+    extractor = PDFExtractor(use_cache=False)
+    return extractor._scan_page_range(pdf_path, start, stop), extractor.metrics.as_dict()
@@ -1,112 +1,362 @@
+import logging
 import re
+import fitz  # PyMuPDF
 import PyPDF2
-from typing import List, Dict, Tuple
+from pathlib import Path
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
+from file_cache import ExtractionCache
+from instrumentation import Metrics, get_logger
+
+logger = get_logger('parser')
+
+# 题型标题及其对应的题型
+SECTION_KEYWORDS = {
+    '选择题': 'single_choice',
+    '单选题': 'single_choice',
+    '判断题': 'true_false',
+    '编程题': 'programming',
+    '程序题': 'programming'
+}
+
+# 题型标题、题号和选项字母题号的词法模式，一次扫描同时识别
+TOKEN_PATTERN = re.compile('|'.join(SECTION_KEYWORDS) + r'|\d+[\.、]|\([A-D]\)')
+
+# 各题型视为题号的词法单元
+NUMBER_KINDS = {
+    'single_choice': ('number', 'letter'),
+    'true_false': ('number',),
+    'programming': ('number',)
+}
+
+NUMBER_PATTERNS = {
+    'single_choice': re.compile(r'\d+[\.、]|\([A-D]\)'),
+    'true_false': re.compile(r'\d+[\.、]'),
+    'programming': re.compile(r'\d+[\.、]')
+}
+
+# 选项模式
+OPTION_PATTERN = re.compile(r'[A-D][\.、](.*?)(?=[A-D][\.、]|$)')
+
+# 题目默认分值
+DEFAULT_SCORES = {
+    'single_choice': 10,
+    'true_false': 5,
+    'programming': 20
+}
+
+
+def iter_segments(page_texts: Iterable[str]) -> Iterator[str]:
+    """把逐页文本切分为以整行结尾的片段，跨页的半行与下一页开头合并"""
+    carry = ''
+    for page_text in page_texts:
+        text = carry + page_text
+        cut = text.rfind('\n') + 1
+        if cut:
+            yield text[:cut]
+        carry = text[cut:]
+    yield carry
+
+
+def token_kind(token: str) -> str:
+    """词法单元的类别：题型名、'number' 或 'letter'"""
+    kind = SECTION_KEYWORDS.get(token)
+    if kind:
+        return kind
+    return 'letter' if token[0] == '(' else 'number'
+
+
+class SectionFinder:
+    """在片段中查找下一个题型标题
+
+    所有状态机都在等待标题时只需定位标题，用 str.find 逐个关键字查找
+    并缓存各自的下一个位置，比通用的词法模式快得多。
+    """
+
+    def __init__(self, segment: str):
+        self.segment = segment
+        self.positions = {keyword: segment.find(keyword) for keyword in SECTION_KEYWORDS}
+
+    def next(self, pos: int) -> Optional[Tuple[str, int, int]]:
+        """返回 pos 之后第一个标题的 (题型, 起点, 终点)"""
+        best = None
+        for keyword, found in self.positions.items():
+            if 0 <= found < pos:
+                found = self.positions[keyword] = self.segment.find(keyword, pos)
+            if found >= 0 and (best is None or found < best[1]):
+                best = (SECTION_KEYWORDS[keyword], found, found + len(keyword))
+        return best
+
+
+class QuestionScanner:
+    """单一题型的状态机
+
+    语义与原先在全文上执行的正则
+    ``标题[^\\n]*(?:\\n|.)*?题号\\s*(.*?)(?=题号|$)`` 的 finditer 结果一致：
+    每遇到一个题型标题，取标题所在行之后的第一个题号，
+    截取到下一个题号（或全文结尾）为止的内容作为一道题。
+    """
+    SEEK_SECTION, SEEK_NUMBER, CAPTURE = range(3)
+
+    def __init__(self, q_type: str):
+        self.q_type = q_type
+        self.number_kinds = NUMBER_KINDS[q_type]
+        self.state = self.SEEK_SECTION
+        # 当前片段内截取或等待的起点
+        self.start = 0
+        # 标题所在行的行尾，之前的题号不参与匹配
+        self.line_end = 0
+        self.parts = []
+
+    def feed(self, kind: str, start: int, end: int, segment: str) -> Optional[str]:
+        """处理一个词法单元，题目结束时返回其原文"""
+        if self.state == self.SEEK_SECTION:
+            if kind == self.q_type:
+                # 标题所在行的剩余部分被跳过，从下一行开始找题号
+                self.state = self.SEEK_NUMBER
+                self.line_end = segment.find('\n', end)
+                if self.line_end < 0:
+                    self.line_end = len(segment)
+                # 保留标题之后的原文，供全文结束时回退匹配
+                self.start = end
+                self.parts = []
+            return None
+
+        if kind not in self.number_kinds:
+            return None
+
+        if self.state == self.SEEK_NUMBER:
+            if start >= self.line_end:
+                self.state = self.CAPTURE
+                self.start = end
+                self.parts = []
+            return None
+
+        self.parts.append(segment[self.start:start])
+        # 下一个题型标题从该题号处开始查找
+        self.state = self.SEEK_SECTION
+        return ''.join(self.parts)
+
+    def end_segment(self, segment: str):
+        """片段结束，保存尚未结束的原文"""
+        if self.state != self.SEEK_SECTION:
+            self.parts.append(segment[self.start:])
+        self.start = 0
+        self.line_end = 0
+
+    def finish(self) -> Optional[str]:
+        """输入结束，返回尚未结束的题目"""
+        state, self.state = self.state, self.SEEK_SECTION
+        if state == self.CAPTURE:
+            return ''.join(self.parts)
+
+        if state == self.SEEK_NUMBER:
+            # 标题之后再无题号时，回退到标题所在行中最后一个题号
+            rest = ''.join(self.parts)
+            line_end = rest.find('\n')
+            if line_end < 0:
+                line_end = len(rest)
+            number = NUMBER_PATTERNS[self.q_type]
+            for start in range(line_end - 1, -1, -1):
+                match = number.match(rest, start)
+                if match:
+                    return rest[match.end():]
+        return None
+
+
+class PyPDF2Backend:
+    """使用 PyPDF2 逐页提取文本"""
+    name = 'pypdf2'
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.metrics = metrics or Metrics()
+
+    def iter_page_texts(self, pdf_path: str) -> Iterator[str]:
+        with open(pdf_path, 'rb') as file:
+            with self.metrics.span('read'):
+                pages = PyPDF2.PdfReader(file).pages
+            for page in pages:
+                with self.metrics.span('extract'):
+                    text = page.extract_text()
+                yield text
+
+
+class PyMuPDFBackend:
+    """使用 PyMuPDF 逐页提取文本，速度明显快于 PyPDF2"""
+    name = 'pymupdf'
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.metrics = metrics or Metrics()
+
+    def iter_page_texts(self, pdf_path: str) -> Iterator[str]:
+        with self.metrics.span('read'):
+            doc = fitz.open(pdf_path)
+        try:
+            for page in doc:
+                with self.metrics.span('extract'):
+                    text = page.get_text()
+                yield text
+        finally:
+            doc.close()
+
+
+# 可选的文本提取后端
+TEXT_BACKENDS = {backend.name: backend for backend in (PyPDF2Backend, PyMuPDFBackend)}
+
 
 class ExamParser:
-    def __init__(self):
-        # 题目类型的正则表达式模式
-        self.patterns = {
-            'single_choice': r'(?:选择题|单选题)[^\n]*(?:\n|.)*?(?:\d+[\.、]|\([A-D]\))\s*(.*?)(?=(?:\d+[\.、]|\([A-D]\))|$)',
-            'true_false': r'(?:判断题)[^\n]*(?:\n|.)*?(?:\d+[\.、])\s*(.*?)(?=\d+[\.、]|$)',
-            'programming': r'(?:编程题|程序题)[^\n]*(?:\n|.)*?(?:\d+[\.、])\s*(.*?)(?=\d+[\.、]|$)'
-        }
-        
-        # 选项模式
-        self.option_pattern = r'[A-D][\.、](.*?)(?=[A-D][\.、]|$)'
-        
-    def parse_pdf(self, pdf_path: str) -> List[Dict]:
-        """解析PDF文件，返回题目列表"""
+    # 解析逻辑或输出格式变化时递增，使旧的缓存结果失效
+    VERSION = 2
+
+    def __init__(self, use_cache: bool = True, backend: str = 'pypdf2'):
+        # 按PDF内容哈希缓存解析结果
+        self.cache = ExtractionCache(Path('exam_data') / 'cache' / 'extraction') if use_cache else None
+        # 默认的文本提取后端，可在每次调用时指定
+        self.backend = self._check_backend(backend)
+        # 各阶段耗时和计数，多次解析累计
+        self.metrics = Metrics()
+
+    def parse_pdf(self, pdf_path: str, backend: Optional[str] = None) -> List[Dict]:
+        """解析PDF文件，按选择题、判断题、编程题的顺序返回题目列表
+
+        解析出错时记录日志并返回空列表；后端名称无效时抛出 ValueError。
+        """
+        backend = self._check_backend(backend or self.backend)
         questions = []
-        
+
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                print("\n=== PDF解析开始 ===")
-                print(f"PDF页数: {len(reader.pages)}")
-                
-                # 提取所有页面的文本
-                for i, page in enumerate(reader.pages):
-                    page_text = page.extract_text()
-                    text += page_text
-                    print(f"\n--- 第{i+1}页内容预览 ---")
-                    print(page_text[:200] + "...")  # 只显示前200个字符
-                
-                print("\n=== 开始识别题目 ===")
-                # 解析不同类型的题目
-                single_choice = self._parse_single_choice(text)
-                print(f"\n找到选择题: {len(single_choice)}道")
-                for q in single_choice:
-                    print(f"- 题目: {q['text'][:50]}...")
-                    print(f"  选项: {q.get('options', [])}")
-                
-                true_false = self._parse_true_false(text)
-                print(f"\n找到判断题: {len(true_false)}道")
-                for q in true_false:
-                    print(f"- 题目: {q['text'][:50]}...")
-                
-                programming = self._parse_programming(text)
-                print(f"\n找到编程题: {len(programming)}道")
-                for q in programming:
-                    print(f"- 题目: {q['text'][:50]}...")
-                
-                questions.extend(single_choice)
-                questions.extend(true_false)
-                questions.extend(programming)
-                
-                print(f"\n=== 解析完成，共找到{len(questions)}道题目 ===\n")
-                
+            logger.info("开始解析PDF: %s", pdf_path)
+            questions = self._group_by_type(self.iter_questions(pdf_path, backend))
+            self._log_summary(questions)
+            logger.info("解析完成，共找到%d道题目", len(questions))
+
         except Exception as e:
-            print(f"\n解析PDF时出错: {str(e)}")
-            
+            logger.error("解析PDF时出错: %s", e)
+
         return questions
-    
-    def _parse_single_choice(self, text: str) -> List[Dict]:
-        """解析单选题"""
-        questions = []
-        matches = re.finditer(self.patterns['single_choice'], text, re.DOTALL)
-        
-        for match in matches:
-            question_text = match.group(1).strip()
+
+    @staticmethod
+    def _check_backend(backend: str) -> str:
+        """检查文本提取后端名称，不在 TEXT_BACKENDS 中时抛出 ValueError"""
+        if backend not in TEXT_BACKENDS:
+            raise ValueError(f"未知的文本提取后端: {backend}")
+        return backend
+
+    def iter_questions(self, pdf_path: str, backend: Optional[str] = None) -> Iterator[Dict]:
+        """逐题产出解析结果
+
+        按题目结束的先后顺序产出，同一时间只保留一页文本。
+        backend 为 TEXT_BACKENDS 中的名称，未指定时使用构造时的后端。
+        题目产出的同时逐题写入缓存的临时文件，完整遍历后才提交，中途停止则不缓存。
+        命中缓存时一次读入缓存的题目列表。
+        """
+        backend = self._check_backend(backend or self.backend)
+
+        cache_key = None
+        if self.cache:
+            # 不同后端提取的文本不同，分别缓存
+            cache_key = self.cache.key_for(pdf_path, f'exam_parser_{backend}', self.VERSION)
+            cached = self.cache.get_questions(cache_key)
+            if cached is not None:
+                self.metrics.incr('cache_hits')
+                yield from cached
+                return
+            self.metrics.incr('cache_misses')
+
+        writer = self.cache.question_writer(cache_key) if cache_key else None
+        try:
+            page_texts = TEXT_BACKENDS[backend](self.metrics).iter_page_texts(pdf_path)
+            if logger.isEnabledFor(logging.DEBUG):
+                page_texts = self._log_pages(page_texts)
+            # 后端的读取和提取阶段嵌套在内，不计入识别耗时
+            for question in self.metrics.time_iter('classify', self._scan(self._count_pages(page_texts))):
+                self.metrics.incr('questions')
+                if writer:
+                    writer.add(question)
+                yield question
+            if writer:
+                writer.commit()
+        finally:
+            if writer:
+                writer.close()
+
+    def _log_summary(self, questions: List[Dict]):
+        """记录各题型识别结果，逐题内容只在调试级别输出"""
+        for q_type, label in (('single_choice', '选择题'), ('true_false', '判断题'), ('programming', '编程题')):
+            found = [q for q in questions if q['type'] == q_type]
+            logger.info("找到%s: %d道", label, len(found))
+            for q in found:
+                logger.debug("- 题目: %s...", q['text'][:50])
+                if q_type == 'single_choice':
+                    logger.debug("  选项: %s", q.get('options', []))
+
+    def _count_pages(self, page_texts: Iterable[str]) -> Iterator[str]:
+        """统计页数"""
+        for page_text in page_texts:
+            self.metrics.incr('pages')
+            yield page_text
+
+    def _log_pages(self, page_texts: Iterable[str]) -> Iterator[str]:
+        """调试级别下逐页记录内容预览"""
+        for i, page_text in enumerate(page_texts):
+            logger.debug("第%d页内容预览: %s...", i + 1, page_text[:200])  # 只显示前200个字符
+            yield page_text
+
+    def parse_pages(self, page_texts: Iterable[str]) -> List[Dict]:
+        """单遍扫描逐页文本，按选择题、判断题、编程题的顺序返回题目"""
+        return self._group_by_type(self._scan(page_texts))
+
+    def _group_by_type(self, questions: Iterable[Dict]) -> List[Dict]:
+        """按选择题、判断题、编程题的顺序排列题目，同类保持原顺序"""
+        found = {q_type: [] for q_type in NUMBER_KINDS}
+        for question in questions:
+            found[question['type']].append(question)
+        return found['single_choice'] + found['true_false'] + found['programming']
+
+    def _scan(self, page_texts: Iterable[str]) -> Iterator[Dict]:
+        """单遍扫描所有词法单元，同时驱动各题型的状态机，按完成顺序产出题目"""
+        scanners = [QuestionScanner(q_type) for q_type in NUMBER_KINDS]
+
+        for segment in iter_segments(page_texts):
+            sections = SectionFinder(segment)
+            pos = 0
+            while True:
+                if all(scanner.state == QuestionScanner.SEEK_SECTION for scanner in scanners):
+                    token = sections.next(pos)
+                else:
+                    match = TOKEN_PATTERN.search(segment, pos)
+                    token = (token_kind(match.group()),) + match.span() if match else None
+                if not token:
+                    break
+                kind, start, pos = token
+                for scanner in scanners:
+                    raw_text = scanner.feed(kind, start, pos, segment)
+                    if raw_text is not None:
+                        question = self._build_question(scanner.q_type, raw_text)
+                        if question:
+                            yield question
+            for scanner in scanners:
+                scanner.end_segment(segment)
+
+        for scanner in scanners:
+            raw_text = scanner.finish()
+            if raw_text is not None:
+                question = self._build_question(scanner.q_type, raw_text)
+                if question:
+                    yield question
+
+    def _build_question(self, q_type: str, raw_text: str) -> Optional[Dict]:
+        """把截取的题目原文整理为题目字典，没有选项的选择题返回 None"""
+        question_text = raw_text.strip()
+        question = {'type': q_type, 'text': question_text}
+
+        if q_type == 'single_choice':
             # 查找选项
-            options = re.findall(self.option_pattern, question_text)
-            if options:
-                # 分离题目和选项
-                main_text = question_text.split('A.')[0].strip()
-                questions.append({
-                    'type': 'single_choice',
-                    'text': main_text,
-                    'options': options,
-                    'score': 10  # 默认分值
-                })
-        
-        return questions
-    
-    def _parse_true_false(self, text: str) -> List[Dict]:
-        """解析判断题"""
-        questions = []
-        matches = re.finditer(self.patterns['true_false'], text, re.DOTALL)
-        
-        for match in matches:
-            questions.append({
-                'type': 'true_false',
-                'text': match.group(1).strip(),
-                'score': 5  # 默认分值
-            })
-        
-        return questions
-    
-    def _parse_programming(self, text: str) -> List[Dict]:
-        """解析编程题"""
-        questions = []
-        matches = re.finditer(self.patterns['programming'], text, re.DOTALL)
-        
-        for match in matches:
-            questions.append({
-                'type': 'programming',
-                'text': match.group(1).strip(),
-                'score': 20  # 默认分值
-            })
-        
-        return questions
+            options = OPTION_PATTERN.findall(question_text)
+            if not options:
+                return None
+            # 分离题目和选项
+            question['text'] = question_text.split('A.')[0].strip()
+            question['options'] = options
+
+        question['score'] = DEFAULT_SCORES[q_type]  # 默认分值
+        return question
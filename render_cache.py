@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# 内存中渲染结果的默认容量
+DEFAULT_RENDER_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def zoom_key(zoom: float) -> float:
+    """缩放倍数作为缓存键时的取值，消除连续放大缩小产生的浮点误差"""
+    return round(zoom, 3)
+
+
+class RenderCache:
+    """按字节预算缓存渲染好的页面图片
+
+    键通常为 (页码, 缩放)，值为可直接显示的图片对象，大小由调用方给出。
+    超出预算时淘汰最久未使用的条目；单个超过预算的条目不缓存。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，命中时标记为最近使用"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """写入缓存并淘汰最久未使用的条目，直到不超出预算"""
+        self.discard(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+
+    def discard(self, key: Hashable):
+        """删除单个条目"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,428 @@
+"""试卷数据访问层
+
+管理界面、两种考试窗口和 GespexamManager 都通过 ExamRepository 读写数据库，
+不再各自打开连接、拼写 SQL。同一进程内共享一个连接（get_repository），
+所有 SQL 都是固定的字符串常量，sqlite3 按语句文本缓存编译结果，
+重复执行时不再重新解析。连接只在 Tk 主线程中使用。
+"""
+import itertools
+import json
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from db import DB_PATH, connect_db
+from grading import GradedAnswer, total_score
+
+# 未给出分值时的默认分值，与题目表的默认值一致
+DEFAULT_QUESTION_SCORE = 10
+
+# 题目列表的列，两种考试窗口和导出共用
+QUESTION_COLUMNS = "id, question_type, question_text, options, correct_answer, question_number, score"
+
+INSERT_RECORD_ANSWERS = """
+    INSERT INTO record_answers (
+        source, record_id, exam_id, question_id, question_number, answer, is_correct, score
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_QUESTION = """
+    INSERT INTO questions (
+        exam_id, question_type, question_text,
+        options, correct_answer, question_number, score,
+        page_number, bbox, question_image_path, options_image_path
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 重新导入修订版时从提取结果更新的题目列，答案和分值由人工维护，保持不变
+EXTRACTED_QUESTION_FIELDS = ('question_type', 'question_text', 'question_image_path',
+                             'options', 'options_image_path', 'page_number', 'bbox')
+
+# 按 exam_id 关联到试卷的表，删除试卷时一并删除
+EXAM_DEPENDENT_TABLES = ('questions', 'answers', 'exam_records', 'exam_results',
+                         'record_answers', 'page_fingerprints', 'ingested_files')
+
+ExamRow = Tuple[int, str, str, int]                                    # id, 名称, 上传时间, 时长
+QuestionRow = Tuple[int, str, str, Optional[str], Optional[str], int, int]
+
+
+class ExamRepository:
+    """试卷、题目和考试记录的读写"""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self.conn = connect_db(path)
+        self._in_transaction = False
+
+    @contextmanager
+    def transaction(self):
+        """写事务：最外层结束时提交（异常时回滚），嵌套的调用并入外层事务
+
+        各写方法都在自己的事务中执行，调用方可以把多个写方法和同一连接上的
+        其他写入放进一个外层事务，一起提交。
+        """
+        if self._in_transaction:
+            yield
+            return
+        self._in_transaction = True
+        try:
+            with self.conn:
+                yield
+        finally:
+            self._in_transaction = False
+
+    # 试卷
+
+    def list_exams(self) -> List[ExamRow]:
+        """试卷列表，最近上传的在前"""
+        return self.conn.execute("""
+            SELECT id, name, upload_time, duration
+            FROM exams
+            ORDER BY upload_time DESC
+        """).fetchall()
+
+    def get_exam(self, exam_id: int) -> Optional[Tuple]:
+        """试卷的状态和各题型数量（管理程序使用）"""
+        return self.conn.execute("""
+            SELECT id, name, file_path, pdf_path, status,
+                   total_questions, single_choice_count,
+                   true_false_count, programming_count
+            FROM exams
+            WHERE id = ?
+        """, (exam_id,)).fetchone()
+
+    def get_exam_info(self, exam_id: int) -> Optional[Tuple[str, str, int]]:
+        """考试窗口需要的 (名称, 文件路径, 考试时长)"""
+        return self.conn.execute("""
+            SELECT name, file_path, duration
+            FROM exams
+            WHERE id = ?
+        """, (exam_id,)).fetchone()
+
+    def get_exam_file(self, exam_id: int) -> Optional[str]:
+        """试卷文件路径，试卷不存在时返回 None"""
+        row = self.conn.execute("SELECT file_path FROM exams WHERE id = ?", (exam_id,)).fetchone()
+        return row[0] if row else None
+
+    def add_exam(self, name: str, original_filename: str, file_path: str, file_type: str,
+                 pdf_path: Optional[str] = None, status: Optional[str] = None) -> int:
+        """添加试卷，返回试卷ID"""
+        with self.transaction():
+            cursor = self.conn.execute("""
+                INSERT INTO exams (name, original_filename, file_path, file_type, pdf_path, status)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, 'pending'))
+            """, (name, original_filename, file_path, file_type, pdf_path, status))
+        return cursor.lastrowid
+
+    def rename_exam(self, exam_id: int, name: str):
+        """修改试卷名称"""
+        with self.transaction():
+            self.conn.execute("UPDATE exams SET name = ? WHERE id = ?", (name, exam_id))
+
+    def delete_exam(self, exam_id: int):
+        """在一个事务中删除试卷及其题目、答案、考试记录、逐题作答、页面指纹和导入记录"""
+        with self.transaction():
+            for table in EXAM_DEPENDENT_TABLES:
+                self.conn.execute(f"DELETE FROM {table} WHERE exam_id = ?", (exam_id,))
+            self.conn.execute("DELETE FROM exams WHERE id = ?", (exam_id,))
+
+    def complete_exam(self, exam_id: int):
+        """重新统计各题型数量并把试卷标记为完成"""
+        with self.transaction():
+            self._update_question_counts(exam_id, 'completed')
+
+    # 题目
+
+    def get_questions(self, exam_id: int) -> List[QuestionRow]:
+        """试卷的所有题目，按题号排列"""
+        return self.conn.execute(f"""
+            SELECT {QUESTION_COLUMNS}
+            FROM questions
+            WHERE exam_id = ?
+            ORDER BY question_number
+        """, (exam_id,)).fetchall()
+
+    def get_question_positions(self, exam_id: int) -> List[Tuple[int, int, list]]:
+        """提取时记录了位置的题目 (题号, 页码, bbox)"""
+        rows = self.conn.execute("""
+            SELECT question_number, page_number, bbox
+            FROM questions
+            WHERE exam_id = ? AND page_number IS NOT NULL AND bbox IS NOT NULL
+        """, (exam_id,)).fetchall()
+        return [(number, page, json.loads(bbox)) for number, page, bbox in rows]
+
+    def add_question(self, exam_id: int, question_type: str, question_text: str,
+                     options: Optional[List[str]] = None, correct_answer: Optional[str] = None,
+                     question_number: Optional[int] = None, score: int = DEFAULT_QUESTION_SCORE) -> int:
+        """添加一道题目，未给出题号时排在最后，返回题目ID"""
+        with self.transaction():
+            if question_number is None:
+                question_number = self._next_question_number(exam_id)
+            cursor = self.conn.execute(INSERT_QUESTION, (
+                exam_id,
+                question_type,
+                question_text,
+                json.dumps(options) if options else None,
+                correct_answer,
+                question_number,
+                score,
+                None,
+                None,
+                None,
+                None
+            ))
+        return cursor.lastrowid
+
+    def add_questions(self, exam_id: int, questions: Iterable[Dict], complete: bool = False) -> int:
+        """批量添加题目，可直接传入两种提取器产出的题目
+
+        ExamParser 的题目为含 type、text、options 的字典，PDFExtractor 的题目为含
+        question_type、question_text、question_number、page_number、bbox 和图片路径的字典，
+        位置和图片路径一并保存，供按题显示使用。题号要么全部给出（不能与已有题目重复），
+        要么全部省略（由第一道题决定），省略时从已有的最大题号之后依次分配。
+        questions 可以是生成器，逐题写入而不整体读入内存；题号不符合要求时抛出 ValueError，
+        已写入的题目一并回滚。所有题目和试卷的题目统计在一个事务中写入，
+        complete 为真时同时把试卷标记为完成。返回写入的题目数。
+        """
+        questions = iter(questions)
+        first = next(questions, None)
+        with self.transaction():
+            inserted = 0
+            if first is not None:
+                rows = self._question_rows(exam_id, itertools.chain([first], questions),
+                                           first.get('question_number') is not None)
+                inserted = self.conn.executemany(INSERT_QUESTION, rows).rowcount
+
+            self._update_question_counts(exam_id, 'completed' if complete else None)
+        return inserted
+
+    def patch_questions(self, exam_id: int, questions: List[Dict]) -> Dict[str, int]:
+        """用修订版的提取结果（PDFExtractor 的题目）按题号修补题目，保留人工维护的答案和分值
+
+        人工维护的答案、分值和 answers 表都按题号对应题目，修订版插入或删除题目时
+        后面的题号整体移动，按题号修补会让答案对应到别的题目，因此检测到
+        题号移动（题目内容不变但题号变化）时抛出 ValueError，不做修改。
+        同时重新统计各题型数量并把试卷标记为完成。返回更新、新增和删除的题目数。
+        """
+        fields = EXTRACTED_QUESTION_FIELDS
+        with self.transaction():
+            existing = {row[0]: row[1:] for row in self.conn.execute(f"""
+                SELECT question_number, {', '.join(fields)}
+                FROM questions
+                WHERE exam_id = ?
+            """, (exam_id,))}
+
+            moved = _find_renumbered(existing, questions)
+            if moved:
+                shown = ", ".join(f"第{old}题 -> 第{new}题" for old, new in moved[:5])
+                if len(moved) > 5:
+                    shown += f" 等{len(moved)}题"
+                raise ValueError(f"修订版的题号发生移动（{shown}），按题号修补会使答案和分值对应到其他题目，"
+                                 "请删除试卷后重新导入")
+
+            updates = []
+            inserts = []
+            for q in questions:
+                values = tuple(q[field] for field in fields)
+                number = q['question_number']
+                if number not in existing:
+                    inserts.append(q)
+                elif existing[number] != values:
+                    updates.append(values + (exam_id, number))
+
+            self.conn.executemany(f"""
+                UPDATE questions
+                SET {', '.join(f'{field} = ?' for field in fields)}
+                WHERE exam_id = ? AND question_number = ?
+            """, updates)
+            self.conn.executemany(INSERT_QUESTION, self._question_rows(exam_id, iter(inserts), True))
+            self.conn.execute("DELETE FROM questions WHERE exam_id = ? AND question_number > ?",
+                              (exam_id, len(questions)))
+            self._update_question_counts(exam_id, 'completed')
+
+        return {
+            'updated': len(updates),
+            'inserted': len(inserts),
+            'deleted': sum(1 for number in existing if number > len(questions))
+        }
+
+    def _next_question_number(self, exam_id: int) -> int:
+        """排在最后的新题目的题号（已有题号不连续时也不会重复）"""
+        return self.conn.execute("SELECT COALESCE(MAX(question_number), 0) + 1 FROM questions WHERE exam_id = ?",
+                                 (exam_id,)).fetchone()[0]
+
+    def _question_rows(self, exam_id: int, questions: Iterator[Dict], explicit: bool) -> Iterator[Tuple]:
+        """逐题产出 INSERT_QUESTION 的参数并分配题号，给出的题号不完整或重复时抛出 ValueError"""
+        # 在 executemany 开始前查询，生成过程中不再访问数据库
+        if explicit:
+            used = {number for number, in self.conn.execute(
+                "SELECT question_number FROM questions WHERE exam_id = ?", (exam_id,))}
+        else:
+            numbers = itertools.count(self._next_question_number(exam_id))
+
+        for q in questions:
+            number = q.get('question_number')
+            if (number is not None) != explicit:
+                raise ValueError("批量添加的题目需要全部给出题号或全部省略题号")
+            if explicit:
+                if number in used:
+                    raise ValueError(f"题号重复: {number}")
+                used.add(number)
+            else:
+                number = next(numbers)
+            yield (
+                exam_id,
+                q['type'] if 'type' in q else q['question_type'],
+                q['text'] if 'text' in q else q['question_text'],
+                _json_field(q.get('options')),
+                q.get('correct_answer'),
+                number,
+                DEFAULT_QUESTION_SCORE if q.get('score') is None else q['score'],
+                q.get('page_number'),
+                _json_field(q.get('bbox')),
+                _json_field(q.get('question_image_path')),
+                _json_field(q.get('options_image_path'))
+            )
+
+    def _update_question_counts(self, exam_id: int, status: Optional[str] = None):
+        """按题目表重新统计试卷的各题型数量，给出 status 时同时更新状态，不提交"""
+        counts = self.conn.execute("""
+            SELECT
+                COUNT(*) as total,
+                SUM(CASE WHEN question_type = 'single_choice' THEN 1 ELSE 0 END) as single_choice,
+                SUM(CASE WHEN question_type = 'true_false' THEN 1 ELSE 0 END) as true_false,
+                SUM(CASE WHEN question_type = 'programming' THEN 1 ELSE 0 END) as programming
+            FROM questions
+            WHERE exam_id = ?
+        """, (exam_id,)).fetchone()
+
+        self.conn.execute("""
+            UPDATE exams SET
+                status = COALESCE(?, status),
+                total_questions = ?,
+                single_choice_count = ?,
+                true_false_count = ?,
+                programming_count = ?
+            WHERE id = ?
+        """, (status, counts[0], counts[1], counts[2], counts[3], exam_id))
+
+    # 答案和考试记录
+
+    def get_answer_key(self, exam_id: int) -> Dict[int, Tuple[str, int]]:
+        """标准答案 {题号: (正确答案, 分值)}"""
+        rows = self.conn.execute("""
+            SELECT question_number, correct_answer, score
+            FROM answers
+            WHERE exam_id = ?
+        """, (exam_id,)).fetchall()
+        return {number: (answer, score) for number, answer, score in rows}
+
+    def record_submission(self, exam_id: int, student_name: str, start_time: str, end_time: str,
+                          answers: Dict, graded: List[GradedAnswer]) -> int:
+        """在一个事务中保存整卷考试界面的考试记录和逐题评分结果，返回记录ID"""
+        with self.transaction():
+            cursor = self.conn.execute("""
+                INSERT INTO exam_records (
+                    exam_id, student_name, start_time,
+                    end_time, answers, score
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, (exam_id, student_name, start_time, end_time, json.dumps(answers), total_score(graded)))
+            self._save_record_answers('exam_records', cursor.lastrowid, exam_id, graded)
+        return cursor.lastrowid
+
+    def record_result(self, exam_id: int, student_name: str, answers: Dict, graded: List[GradedAnswer]) -> int:
+        """在一个事务中保存逐题考试界面的考试结果和逐题评分结果，返回结果ID"""
+        with self.transaction():
+            cursor = self.conn.execute("""
+                INSERT INTO exam_results (exam_id, student_name, end_time, total_score, answers)
+                VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?)
+            """, (exam_id, student_name, total_score(graded), json.dumps(answers)))
+            self._save_record_answers('exam_results', cursor.lastrowid, exam_id, graded)
+        return cursor.lastrowid
+
+    def _save_record_answers(self, source: str, record_id: int, exam_id: int, graded: List[GradedAnswer]):
+        """写入逐题评分结果，不提交"""
+        self.conn.executemany(INSERT_RECORD_ANSWERS, [
+            (source, record_id, exam_id) + tuple(row)
+            for row in graded
+        ])
+
+    def question_stats(self, exam_id: int, include_backfilled: bool = True
+                       ) -> List[Tuple[Optional[int], int, int, int, Optional[float], Optional[float]]]:
+        """各题的 (题目ID, 题号, 作答人次, 答对人次, 正确率, 平均得分)，只统计已评分的作答
+
+        逐题考试界面的作答按题目ID分组（题号可能重复），整卷考试界面按题号作答，
+        题目ID为 None，按题号分组。
+        迁移回填的历史作答按迁移时的标准答案评分，可能与当时保存的总分不一致，
+        include_backfilled 为假时只统计提交时评分的作答。
+        """
+        return self.conn.execute("""
+            SELECT question_id,
+                   question_number,
+                   COUNT(is_correct) AS attempts,
+                   SUM(is_correct) AS correct,
+                   AVG(is_correct) AS correct_rate,
+                   AVG(score) AS average_score
+            FROM record_answers
+            WHERE exam_id = ? AND (? OR backfilled = 0)
+            GROUP BY question_number, question_id
+            ORDER BY question_number, question_id
+        """, (exam_id, include_backfilled)).fetchall()
+
+    def question_correct_rate(self, exam_id: int, question_number: int,
+                              include_backfilled: bool = True) -> Optional[float]:
+        """某道题的正确率，没有已评分的作答时返回 None"""
+        return self.conn.execute("""
+            SELECT AVG(is_correct)
+            FROM record_answers
+            WHERE exam_id = ? AND question_number = ? AND (? OR backfilled = 0)
+        """, (exam_id, question_number, include_backfilled)).fetchone()[0]
+
+    def close(self):
+        """关闭连接"""
+        self.conn.close()
+
+
+def _find_renumbered(existing: Dict[int, Tuple], questions: List[Dict]) -> List[Tuple[int, int]]:
+    """按题目内容匹配新旧题目，返回内容不变但题号变化的 (旧题号, 新题号)
+
+    existing 为 {题号: EXTRACTED_QUESTION_FIELDS 各列}。只使用在新旧版本中都唯一的题目内容，
+    重复的内容无法确定对应关系。
+    """
+    old_numbers = {}
+    for number, values in existing.items():
+        old_numbers.setdefault(values[1], []).append(number)
+    new_texts = {}
+    for q in questions:
+        new_texts[q['question_text']] = new_texts.get(q['question_text'], 0) + 1
+
+    moved = []
+    for q in questions:
+        numbers = old_numbers.get(q['question_text'], [])
+        if len(numbers) == 1 and new_texts[q['question_text']] == 1 and numbers[0] != q['question_number']:
+            moved.append((numbers[0], q['question_number']))
+    return sorted(moved)
+
+
+def _json_field(value):
+    """列表等结构转为JSON文本，提取器已序列化的字符串原样保存，空值保存为 NULL"""
+    if not value:
+        return None
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+_repositories: Dict[str, ExamRepository] = {}
+
+
+def get_repository(path: str = DB_PATH) -> ExamRepository:
+    """进程内共享的仓库，同一数据库只打开一个连接"""
+    repository = _repositories.get(path)
+    if repository is None:
+        repository = _repositories[path] = ExamRepository(path)
+    return repository
+
+
+def close_repositories():
+    """程序退出前关闭所有共享连接"""
+    while _repositories:
+        _, repository = _repositories.popitem()
+        repository.close()